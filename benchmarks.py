@@ -0,0 +1,606 @@
+"""
+Benchmarks for the TOAH model and solvers.
+
+Run this module directly to print the timings, optionally writing them as
+JSON so that results can be compared between versions:
+
+    python benchmarks.py
+    python benchmarks.py --only model tour --cheeses 10 20 --stools 3 4
+    python benchmarks.py --json results.json
+
+Benchmarks in OPT_IN take minutes and gigabytes, and only run when named
+with --only.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import tour
+import toah_search
+import toah_pattern_db
+import toah_file
+import toah_cache
+from toah_model import TOAHModel, Cheese, MoveSequence, verify_moves
+
+
+def _best_time(func, repeat=5):
+    """ Return the best wall-clock time, in seconds, of repeat calls to func.
+
+    @param function func:
+    @param int repeat:
+    @rtype: float
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_split_table(sizes=(20, 50, 100)):
+    """ Time building the Frame-Stewart table and reading splits from it.
+
+    For each n in sizes report the cold build time of the table and the
+    total time for the n table lookups one tour makes, next to the time
+    of the whole tour for comparison.
+
+    @param tuple[int] sizes:
+    @rtype: list[dict]
+    """
+    results = []
+    for n in sizes:
+        def build():
+            tour._SPLIT_TABLES.clear()
+            tour.split_table(n)
+        build_time = _best_time(build)
+        splits = tour.split_table(n)[1]
+        lookup_time = _best_time(lambda: [splits[m] for m in range(n + 1)])
+
+        def solve():
+            model = TOAHModel(4)
+            model.fill_first_stool(n)
+            tour.tour_of_four_stools(model)
+        results.append({'n': n, 'build_s': build_time,
+                        'lookup_s': lookup_time,
+                        'tour_s': _best_time(solve, repeat=1)})
+    return results
+
+
+def bench_solver_modes(cases=((20, 3), (100, 4), (40, 5))):
+    """ Compare moves per second of the recursive and iterative solvers.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        row = {'n': n, 'stools': stools,
+               'moves': tour.split_table(n, stools)[0][n]}
+        for mode, iterative in (('recursive', False), ('iterative', True)):
+            def drain():
+                for _ in tour.tour_moves(n, stools, iterative):
+                    pass
+            row[mode] = row['moves'] / _best_time(drain, repeat=3)
+        results.append(row)
+    return results
+
+
+def bench_cheese_location(number_of_cheeses=10000, number_of_stools=4):
+    """ Compare get_cheese_location with a linear scan over the stools.
+
+    The cheeses are spread round-robin over the stools, and every cheese
+    is looked up once.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @rtype: dict
+    """
+    model = TOAHModel(number_of_stools)
+    for size in range(number_of_cheeses, 0, -1):
+        model.add(Cheese(size), size % number_of_stools)
+    cheeses = [Cheese(size) for size in range(1, number_of_cheeses + 1)]
+
+    def scan():
+        for cheese in cheeses:
+            for stool_index in range(number_of_stools):
+                if cheese in model._stools[stool_index]:
+                    break
+
+    def indexed():
+        for cheese in cheeses:
+            model.get_cheese_location(cheese)
+    return {'cheeses': number_of_cheeses,
+            'scan_s': _best_time(scan, repeat=1) / number_of_cheeses,
+            'indexed_s': _best_time(indexed) / number_of_cheeses}
+
+
+def bench_verifier(cases=((22, 3), (100, 4))):
+    """ Measure verify_moves throughput on packed tour solutions.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        moves = MoveSequence(list(tour.tour_moves(n, stools)))
+        elapsed = _best_time(lambda: verify_moves(moves, stools, n),
+                             repeat=3)
+        results.append({'n': n, 'stools': stools, 'moves': moves.length(),
+                        'moves_per_s': moves.length() / elapsed})
+    return results
+
+
+def _full_render(model):
+    """ Return model drawn from scratch, the way TOAHModel.__str__ did
+    before it cached rows.
+
+    @param TOAHModel model:
+    @rtype: str
+    """
+    max_size = max([stool[-1 - i].size for stool in model._stools
+                    for i in range(len(stool))] or [0])
+    stool_str = '=' * (2 * max_size + 1)
+    lines = ''
+    for height in range(model.get_number_of_cheeses() - 1, -1, -1):
+        line = ''
+        for stool in model._stools:
+            size = stool[height].size if height < len(stool) else 0
+            if size == 0:
+                s = ' ' * len(stool_str)
+            else:
+                filler = ' ' * (max_size - size + 1)
+                s = filler + '-' * (2 * size - 1) + filler
+            line += s + '  '
+        lines += line + '\n'
+    return lines + (stool_str + '  ') * len(model._stools)
+
+
+def bench_render(number_of_cheeses=30, number_of_stools=8, moves=2000):
+    """ Compare rendering after every move with the cached __str__ against
+    drawing the whole picture from scratch.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param int moves:
+    @rtype: dict
+    """
+    tour_moves = list(tour.tour_moves(number_of_cheeses,
+                                      number_of_stools))[:moves]
+
+    def play(render):
+        model = TOAHModel(number_of_stools)
+        model.fill_first_stool(number_of_cheeses)
+        for src, dst in tour_moves:
+            model.move(src, dst)
+            render(model)
+    return {'cheeses': number_of_cheeses, 'stools': number_of_stools,
+            'full_s': _best_time(lambda: play(_full_render), repeat=3)
+            / len(tour_moves),
+            'cached_s': _best_time(lambda: play(str), repeat=3)
+            / len(tour_moves)}
+
+
+def bench_parallel_generation(cases=((25, 3), (200, 4)),
+                              processes=(1, 2, 4)):
+    """ Time tour_move_sequence with different process pool sizes.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @param tuple[int] processes:
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        for p in processes:
+            elapsed = _best_time(
+                lambda: tour.tour_move_sequence(n, stools, p), repeat=1)
+            results.append({'n': n, 'stools': stools, 'processes': p,
+                            'moves': tour.split_table(n, stools)[0][n],
+                            'seconds': elapsed})
+    return results
+
+
+def _tower(number_of_stools, number_of_cheeses, stool_index):
+    """ Return a TOAHModel with every cheese on stool_index.
+
+    @param int number_of_stools:
+    @param int number_of_cheeses:
+    @param int stool_index:
+    @rtype: TOAHModel
+    """
+    model = TOAHModel(number_of_stools)
+    for size in range(number_of_cheeses, 0, -1):
+        model.add(Cheese(size), stool_index)
+    return model
+
+
+def bench_search(cases=((10, 3), (8, 4), (10, 4)), heuristic=None):
+    """ Time shortest_moves moving a whole tower from the first stool to
+    the last, and check the result against the Frame-Stewart number.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @param function|None heuristic: passed on to shortest_moves
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        start = _tower(stools, n, 0)
+        goal = _tower(stools, n, stools - 1)
+        begin = time.perf_counter()
+        moves = toah_search.shortest_moves(start, goal, heuristic)
+        results.append({'n': n, 'stools': stools, 'moves': moves.length(),
+                        'frame_stewart': tour.split_table(n, stools)[0][n],
+                        'seconds': time.perf_counter() - begin})
+    return results
+
+
+def bench_pattern_database(pattern_cheeses=8, cases=((10, 4),)):
+    """ Time building a pattern database for the largest pattern_cheeses
+    cheeses on the last stool, then searching with it.
+
+    @param int pattern_cheeses:
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.pdb')
+        begin = time.perf_counter()
+        toah_pattern_db.build_pattern_database(
+            path, [stools - 1] * pattern_cheeses, stools)
+        build = time.perf_counter() - begin
+        database = toah_pattern_db.PatternDatabase(path)
+        row = bench_search(((n, stools),), database.heuristic(
+            _tower(stools, n, stools - 1)))[0]
+        row.update({'pattern': pattern_cheeses, 'build_s': build,
+                    'bytes': os.path.getsize(path)})
+        database.close()
+        os.remove(path)
+        results.append(row)
+    return results
+
+
+def bench_large_search(pattern_cheeses=12, cases=((15, 4),)):
+    """ Time bench_pattern_database on searches too large for
+    misplaced_heuristic alone, also reporting the peak resident memory of
+    the process.
+
+    @param int pattern_cheeses:
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    import resource
+    results = bench_pattern_database(pattern_cheeses, cases)
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    for row in results:
+        row['peak_rss'] = peak
+    return results
+
+
+def bench_move_file(cases=((20, 3), (25, 3), (200, 12))):
+    """ Time writing a tour to a game file, reading it back as a
+    MoveSequence and replaying it to a TOAHModel.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        moves = tour.tour_move_sequence(n, stools)
+        path = os.path.join(tempfile.mkdtemp(), 'bench.toah')
+        begin = time.perf_counter()
+        with toah_file.MoveWriter(path, stools, n) as writer:
+            writer.write_moves(moves)
+        write = time.perf_counter() - begin
+        with toah_file.MoveFile(path) as game:
+            begin = time.perf_counter()
+            game.move_sequence()
+            read = time.perf_counter() - begin
+            begin = time.perf_counter()
+            game.to_model()
+            replay = time.perf_counter() - begin
+        results.append({'cheeses': n, 'stools': stools,
+                        'moves': moves.length(),
+                        'bytes': os.path.getsize(path), 'write_s': write,
+                        'read_s': read, 'replay_s': replay})
+        os.remove(path)
+    return results
+
+
+def bench_tour_cache(cases=((20, 3), (24, 3), (60, 4))):
+    """ Time a TourCache lookup that solves the tour, one answered from
+    disk by a fresh cache, and one answered from memory.
+
+    @param tuple[tuple[int]] cases: (number of cheeses, number of stools)
+    @rtype: list[dict]
+    """
+    results = []
+    for n, stools in cases:
+        directory = tempfile.mkdtemp()
+        cache = toah_cache.TourCache(directory)
+        begin = time.perf_counter()
+        moves = cache.get(n, stools)
+        miss = time.perf_counter() - begin
+        hit = _best_time(lambda: cache.get(n, stools), repeat=100)
+        disk = _best_time(
+            lambda: toah_cache.TourCache(directory).get(n, stools), repeat=3)
+        cache.clear()
+        os.rmdir(directory)
+        results.append({'cheeses': n, 'stools': stools,
+                        'moves': moves.length(), 'miss_s': miss,
+                        'disk_s': disk, 'hit_s': hit})
+    return results
+
+
+def bench_model(cheeses=(10, 20, 30), stools=(3, 4, 8), moves=100000):
+    """ Measure the TOAHModel hot paths over a sweep of sizes.
+
+    For every pair of cheese and stool counts, report move throughput
+    over the first moves of the tour, get_cheese_location latency, the
+    cost of __eq__ between equal models and the time of __str__, both
+    drawn from scratch and redrawn after one move.
+
+    @param tuple[int] cheeses:
+    @param tuple[int] stools:
+    @param int moves: most tour moves to play per size
+    @rtype: list[dict]
+    """
+    results = []
+    for n, k in itertools.product(cheeses, stools):
+        tour_moves = list(itertools.islice(tour.tour_moves(n, k), moves))
+
+        def play():
+            model = TOAHModel(k)
+            model.fill_first_stool(n)
+            for src, dst in tour_moves:
+                model.move(src, dst)
+            return model
+        move_s = _best_time(play, repeat=3)
+        model, other = play(), play()
+        cheese_list = [Cheese(size) for size in range(1, n + 1)]
+        location_s = _best_time(lambda: [model.get_cheese_location(c)
+                                         for c in cheese_list]) / n
+        eq_s = _best_time(lambda: model == other)
+
+        def draw_fresh():
+            fresh = TOAHModel(k)
+            fresh.fill_first_stool(n)
+            str(fresh)
+        fresh_s = _best_time(draw_fresh)
+        start = TOAHModel(k)
+        start.fill_first_stool(n)
+        str(start)
+        src, dst = tour_moves[0] if tour_moves else (0, 0)
+
+        def redraw():
+            start.move(src, dst)
+            str(start)
+            start.move(dst, src)
+            str(start)
+        redraw_s = _best_time(redraw) / 2 if tour_moves else 0.0
+        results.append({'cheeses': n, 'stools': k,
+                        'moves_per_s': len(tour_moves) / move_s,
+                        'location_s': location_s, 'eq_s': eq_s,
+                        'str_fresh_s': fresh_s, 'str_after_move_s': redraw_s})
+    return results
+
+
+def bench_tour(cheeses=(10, 15, 20, 25)):
+    """ Measure time and peak traced memory of tour_of_four_stools.
+
+    @param tuple[int] cheeses:
+    @rtype: list[dict]
+    """
+    results = []
+    for n in cheeses:
+        def solve():
+            model = TOAHModel(4)
+            model.fill_first_stool(n)
+            tour.tour_of_four_stools(model)
+        seconds = _best_time(solve, repeat=3)
+        tracemalloc.start()
+        solve()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append({'cheeses': n, 'moves': tour.min_moves(n),
+                        'seconds': seconds, 'peak_bytes': peak})
+    return results
+
+
+def bench_replay(cheeses=(10, 15, 20), stools=(3, 4)):
+    """ Measure MoveSequence.generate_toah_model replay speed.
+
+    @param tuple[int] cheeses:
+    @param tuple[int] stools:
+    @rtype: list[dict]
+    """
+    results = []
+    for n, k in itertools.product(cheeses, stools):
+        moves = tour.tour_move_sequence(n, k)
+        seconds = _best_time(lambda: moves.generate_toah_model(k, n),
+                             repeat=3)
+        results.append({'cheeses': n, 'stools': k, 'moves': moves.length(),
+                        'moves_per_s': moves.length() / seconds})
+    return results
+
+
+def bench_batch(games=(1000, 10000), steps=200, number_of_stools=4,
+                number_of_cheeses=8):
+    """ Compare random move streams applied with BatchGames against a loop
+    over TOAHModel.move. Needs NumPy.
+
+    @param tuple[int] games: batch sizes
+    @param int steps: moves per game
+    @param int number_of_stools:
+    @param int number_of_cheeses:
+    @rtype: list[dict]
+    """
+    import numpy as np
+    import toah_batch
+    from toah_model import IllegalMoveError
+    results = []
+    rng = np.random.default_rng(0)
+    for n in games:
+        srcs = rng.integers(0, number_of_stools, (steps, n))
+        dsts = rng.integers(0, number_of_stools, (steps, n))
+
+        def batch():
+            batch_games = toah_batch.BatchGames(n, number_of_stools,
+                                                number_of_cheeses,
+                                                record=False)
+            for src, dst in zip(srcs, dsts):
+                batch_games.step(src, dst)
+        loop_games = min(n, 1000)
+        loop_srcs, loop_dsts = srcs[:, :loop_games].tolist(), \
+            dsts[:, :loop_games].tolist()
+
+        def loop():
+            models = [TOAHModel(number_of_stools) for _ in range(loop_games)]
+            for model in models:
+                model.fill_first_stool(number_of_cheeses)
+            for src_row, dst_row in zip(loop_srcs, loop_dsts):
+                for model, src, dst in zip(models, src_row, dst_row):
+                    try:
+                        model.move(src, dst)
+                    except IllegalMoveError:
+                        pass
+        results.append({'games': n, 'steps': steps,
+                        'batch_moves_per_s':
+                        n * steps / _best_time(batch, repeat=3),
+                        'loop_moves_per_s':
+                        loop_games * steps / _best_time(loop, repeat=1)})
+    return results
+
+
+# name -> (benchmark, whether it takes the --cheeses/--stools sweep,
+# format of one result row)
+BENCHMARKS = {
+    'model': (bench_model, True,
+              'model {cheeses} cheeses x {stools} stools: '
+              '{moves_per_s:.0f} moves/s, location {location_s:.2e}s, '
+              'eq {eq_s:.2e}s, str {str_fresh_s:.2e}s fresh / '
+              '{str_after_move_s:.2e}s after a move'),
+    'tour': (bench_tour, True,
+             'tour {cheeses} cheeses ({moves} moves): {seconds:.4f}s, '
+             'peak {peak_bytes} bytes'),
+    'replay': (bench_replay, True,
+               'replay {cheeses} cheeses x {stools} stools ({moves} moves): '
+               '{moves_per_s:.0f} moves/s'),
+    'split_table': (bench_split_table, False,
+                    'split table n={n}: build {build_s:.6f}s, '
+                    'lookups {lookup_s:.6f}s, tour {tour_s:.6f}s'),
+    'solver_modes': (bench_solver_modes, False,
+                     'solver n={n} stools={stools} ({moves} moves): '
+                     'recursive {recursive:.0f} moves/s, iterative '
+                     '{iterative:.0f} moves/s'),
+    'cheese_location': (lambda: [bench_cheese_location()], False,
+                        'cheese location ({cheeses} cheeses): scan '
+                        '{scan_s:.2e}s, indexed {indexed_s:.2e}s per lookup'),
+    'verifier': (bench_verifier, False,
+                 'verifier n={n} stools={stools} ({moves} moves): '
+                 '{moves_per_s:.0f} moves/s'),
+    'render': (lambda: [bench_render()], False,
+               'render {cheeses} cheeses x {stools} stools: full '
+               '{full_s:.2e}s, cached {cached_s:.2e}s per move'),
+    'parallel_generation': (bench_parallel_generation, False,
+                            'packed tour n={n} stools={stools} ({moves} '
+                            'moves) with {processes} processes: '
+                            '{seconds:.3f}s'),
+    'batch': (bench_batch, False,
+              'batch of {games} games x {steps} steps: {batch_moves_per_s:.0f}'
+              ' moves/s, TOAHModel loop {loop_moves_per_s:.0f} moves/s'),
+    'search': (bench_search, False,
+               'search n={n} stools={stools}: {moves} moves (Frame-Stewart '
+               '{frame_stewart}) in {seconds:.2f}s'),
+    'move_file': (bench_move_file, False,
+                  'game file n={cheeses} stools={stools} ({moves} moves, '
+                  '{bytes} bytes): write {write_s:.3f}s, read '
+                  '{read_s:.3f}s, replay {replay_s:.2f}s'),
+    'tour_cache': (bench_tour_cache, False,
+                   'tour cache n={cheeses} stools={stools} ({moves} moves): '
+                   'miss {miss_s:.4f}s, disk {disk_s:.4f}s, memory '
+                   '{hit_s:.2e}s'),
+    'pattern_database': (bench_pattern_database, False,
+                         'pattern database of {pattern} cheeses ({bytes} '
+                         'bytes) built in {build_s:.2f}s; search n={n} '
+                         'stools={stools}: {moves} moves in '
+                         '{seconds:.2f}s'),
+    'large_search': (bench_large_search, False,
+                     'pattern database of {pattern} cheeses ({bytes} bytes) '
+                     'built in {build_s:.1f}s; search n={n} '
+                     'stools={stools}: {moves} moves (Frame-Stewart '
+                     '{frame_stewart}) in {seconds:.1f}s, peak RSS '
+                     '{peak_rss} bytes'),
+}
+
+# run only when asked for by name
+OPT_IN = {'large_search'}
+
+
+def _environment():
+    """ Return a description of where the benchmarks ran.
+
+    @rtype: dict
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(
+                                    __file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'commit': commit}
+
+
+def run(names=None, cheeses=None, stools=None):
+    """ Run the named benchmarks (all by default), printing each result,
+    and return them with the environment they ran in.
+
+    @param list[str]|None names: benchmarks to run, by default all those
+        not in OPT_IN
+    @param tuple[int]|None cheeses: sweep for the benchmarks that take one
+    @param tuple[int]|None stools: sweep for the benchmarks that take one
+    @rtype: dict
+    """
+    results = {}
+    for name in names or [name for name in BENCHMARKS if name not in OPT_IN]:
+        func, sweeps, line = BENCHMARKS[name]
+        kwargs = {}
+        if sweeps and cheeses:
+            kwargs['cheeses'] = tuple(cheeses)
+        if sweeps and stools and name != 'tour':
+            kwargs['stools'] = tuple(stools)
+        results[name] = func(**kwargs)
+        for row in results[name]:
+            print(line.format(**row))
+    return {'environment': _environment(), 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS),
+                        help='benchmarks to run (default: all but '
+                             '{})'.format(', '.join(sorted(OPT_IN))))
+    parser.add_argument('--cheeses', nargs='+', type=int,
+                        help='cheese counts for the sweeping benchmarks')
+    parser.add_argument('--stools', nargs='+', type=int,
+                        help='stool counts for the sweeping benchmarks')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    report = run(args.only, args.cheeses, args.stools)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -3,7 +3,8 @@ ConsoleController: User interface for manually solving
 Anne Hoy's problems from the console.
 """
 
-from toah_model import TOAHModel, IllegalMoveError
+import sys
+from toah_model import TOAHModel, Cheese, IllegalMoveError, Verification
 
 
 def move(model, origin, dest):
@@ -19,26 +20,48 @@ def move(model, origin, dest):
         stool number you want to move cheese to
     @rtype: None
     """
+    error = move_error(model, origin, dest)
+    if error is not None:
+        print(error)
+
+
+def move_error(model, origin, dest):
+    """ Apply move from origin to destination in model, or return the
+    message explaining why it is illegal.
+
+    @param TOAHModel model:
+        model to modify
+    @param int origin:
+        stool number (index from 0) of cheese to move
+    @param int dest:
+        stool number you want to move cheese to
+    @rtype: str|None
+    """
     try:
         model.move(origin, dest)
     except IllegalMoveError:
         if origin == dest:
-            print('Error, cheese cannot be moved to same stool,'
-                  'Try Again\n')
+            return ('Error, cheese cannot be moved to same stool,'
+                    'Try Again\n')
         else:
-            print('Error, cheese being moved is bigger than cheese at stool,'
-                  'Try Again!\n')
+            return ('Error, cheese being moved is bigger than cheese at '
+                    'stool,Try Again!\n')
+    return None
 
 class ConsoleController:
     """ Controller for text console.
     """
 
-    def __init__(self, number_of_cheeses, number_of_stools):
+    def __init__(self, number_of_cheeses, number_of_stools,
+                 instrumentation=None):
         """ Initialize a new ConsoleController self.
 
         @param ConsoleController self:
         @param int number_of_cheeses:
         @param int number_of_stools:
+        @param Instrumentation|None instrumentation:
+            if given, records model operations and the time taken by
+            each input
         @rtype: None
         """
        
@@ -48,6 +71,9 @@ class ConsoleController:
         
         self.toah = TOAHModel(number_of_stools)
         self.toah.fill_first_stool(number_of_cheeses)
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self.toah)
         
         self.instructions = \
         ('The objective of the game is to move the given stack of cheeses \n'
@@ -63,30 +89,246 @@ class ConsoleController:
         @param ConsoleController self:
         @rtype: None
         """
+        read = input if self.instrumentation is None else \
+            self.instrumentation.timed(input, 'input')
         print(self.instructions)      
-        command = input("Enter a move or type Quit to exit: ")
+        command = read("Enter a move or type Quit to exit: ")
         while command != 'Quit':
-            c = command.strip().split(',')
-            try:
-                if command == 'Info':
-                    print(self.instructions)
-                elif len(c) != 2 or not(c[0].isnumeric() and c[1].isnumeric()):
-                    raise IllegalMoveError 
-                elif not 0 < int(c[0]) <= int(self.number_of_stools):
-                    print('Error ' + c[0] + ' is not within the range\n')
-                elif not 0 < int(c[1]) <= int(self.number_of_stools):
-                    print('Error ' + c[1] + ' is not within the range\n')
-                elif not self.toah.get_top_cheese(int(c[0]) - 1):
-                    print('stool ' + str(int(c[0]) -1) + ' has No cheese!')
-                else:
-                    move(self.toah, int(c[0]) - 1, int(c[1]) - 1)
-                    print(self.toah)
-            except IllegalMoveError:
-                print('Incorrect input, input must be positve #,#, Info or Quit\n')
-            command = input("Enter a move or type Quit to exit: ")
+            print(self.respond(command))
+            command = read("Enter a move or type Quit to exit: ")
         print("\nYou have successfully quit the game!")   
+
+    def respond(self, command):
+        """ Return what play_loop prints in reply to command, which is not
+        Quit, making the move if command is a legal one.
+
+        @param ConsoleController self:
+        @param str command:
+        @rtype: str
+
+        >>> play = ConsoleController(2, 3)
+        >>> play.respond('1,4')
+        'Error 4 is not within the range\\n'
+        >>> play.respond('2,3')
+        'stool 1 has No cheese!'
+        >>> play.respond('1,2') == str(play.toah)
+        True
+        >>> play.respond('1,2').splitlines()[0]
+        'Error, cheese being moved is bigger than cheese at stool,Try Again!'
+        """
+        c = command.strip().split(',')
+        if command == 'Info':
+            return self.instructions
+        elif len(c) != 2 or not(c[0].isnumeric() and c[1].isnumeric()):
+            return 'Incorrect input, input must be positve #,#, Info or Quit\n'
+        elif not 0 < int(c[0]) <= int(self.number_of_stools):
+            return 'Error ' + c[0] + ' is not within the range\n'
+        elif not 0 < int(c[1]) <= int(self.number_of_stools):
+            return 'Error ' + c[1] + ' is not within the range\n'
+        elif not self.toah.get_top_cheese(int(c[0]) - 1):
+            return 'stool ' + str(int(c[0]) -1) + ' has No cheese!'
+        error = move_error(self.toah, int(c[0]) - 1, int(c[1]) - 1)
+        if error is None:
+            return str(self.toah)
+        return error + '\n' + str(self.toah)
+
+    def play_batch(self, stream, render_every=0, chunk_size=1 << 20):
+        """ Play the commands read from stream (a file, or a pipe such as
+        sys.stdin) without prompting, and print a summary.
+
+        Commands are separated by whitespace, and use the console's x,y,
+        Info and Quit forms. They are read chunk_size bytes at a time and
+        checked against plain lists of cheese sizes. As in play_loop,
+        commands that are rejected are skipped, and play goes on. If
+        render_every is positive, the game is printed after each chunk
+        that takes it past another render_every commands.
+
+        self.toah is replaced by a model in the final configuration, whose
+        move sequence holds the moves made before and during the batch.
+
+        @param ConsoleController self:
+        @param file stream:
+        @param int render_every:
+        @param int chunk_size:
+        @rtype: Verification
+
+        >>> import io
+        >>> play = ConsoleController(2, 3)
+        >>> result = play.play_batch(io.StringIO('1,2 1,2 Info 1,3\\n2,3\\n'))
+        Moves applied: 3
+        Rejected commands: 1
+        First error: command 1: Error, cheese being moved is bigger \
+than cheese at stool,Try Again!
+        Solved: yes
+        >>> result.error_index, result.solved
+        (1, True)
+        >>> play.toah.get_move_seq()
+        [(0, 1), (0, 2), (1, 2)]
+
+        A record that no longer packs one byte per move is extended too:
+
+        >>> from toah_model import MoveSequence
+        >>> play = ConsoleController(1, 3)
+        >>> play.toah.set_move_seq(MoveSequence([(-1, 0)]))
+        >>> result = play.play_batch(io.StringIO('1,3'))
+        Moves applied: 1
+        Rejected commands: 0
+        First error: none
+        Solved: yes
+        >>> play.toah.get_move_seq()
+        [(-1, 0), (0, 2)]
+        """
+        k, n = self.number_of_stools, self.number_of_cheeses
+        # every stool keeps a bottom cheese larger than any real one
+        bottom = n + 1
+        stools = [[bottom] for _ in range(k)]
+        for size in range(n, 0, -1):
+            stools[self.toah.get_cheese_location(Cheese(size))].append(size)
+        # Applied moves are recorded in the model's move sequence, packed
+        # one byte per move a chunk at a time while stools fit in a nibble.
+        moves = self.toah.get_move_seq()
+        packed = k <= 16
+        applied_codes = bytearray()
+        if packed:
+            record = applied_codes.append
+        else:
+            def record(move):
+                moves.add_move(*move)
+        # each well-formed move, as it is spelled, to the lists of its
+        # stools and its record (or False, for a move onto the same stool)
+        pairs = {}
+        for s in range(k):
+            for d in range(k):
+                pairs[b'%d,%d' % (s + 1, d + 1)] = \
+                    (stools[s], stools[d], s << 4 | d if packed else (s, d)) \
+                    if s != d else False
+        read = getattr(stream, 'buffer', stream).read
+        carry = b''
+        commands = skipped = rejected = 0
+        error_index = error = None
+        next_render = render_every
+        chunk = True
+        while chunk:
+            chunk = read(chunk_size)
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = carry + chunk
+            tokens = data.split()
+            carry = b''
+            if chunk and tokens and not data[-1:].isspace():
+                # the last command may continue in the next chunk
+                carry = tokens.pop()
+            for index, token in enumerate(tokens, commands):
+                pair = pairs.get(token)
+                if pair:
+                    source, destination, code = pair
+                    if source[-1] < destination[-1]:
+                        destination.append(source.pop())
+                        record(code)
+                        continue
+                if token == b'Quit':
+                    commands, chunk = index, b''
+                    break
+                if token == b'Info':
+                    skipped += 1
+                    continue
+                message = self._batch_move(token, stools, pairs, record)
+                if message is not None:
+                    rejected += 1
+                    if error is None:
+                        error_index, error = index, message
+            else:
+                commands += len(tokens)
+            if applied_codes:
+                moves.extend_packed(applied_codes)
+                del applied_codes[:]
+            if render_every > 0 and commands >= next_render:
+                next_render = (commands // render_every + 1) * render_every
+                self._set_configuration(stools, moves)
+                print(self.toah)
+        self._set_configuration(stools, moves)
+        solved = len(stools[-1]) == bottom
+        applied = commands - skipped - rejected
+        print('Moves applied: {}'.format(applied))
+        print('Rejected commands: {}'.format(rejected))
+        print('First error: ' + ('none' if error is None else
+                                 'command {}: {}'.format(error_index, error)))
+        print('Solved: ' + ('yes' if solved else 'no'))
+        return Verification(applied, error_index, error, solved)
+
+    def _batch_move(self, token, stools, pairs, record):
+        """ Apply the move command token, which is not spelled the way
+        play_batch expects, or return why it is rejected. The checks and
+        messages are those of play_loop.
+
+        @param ConsoleController self:
+        @param bytes token:
+        @param list[list[int]] stools:
+        @param dict pairs:
+        @param function record: called with the move's record once applied
+        @rtype: str|None
+        """
+        c = token.decode(errors='replace').split(',')
+        if len(c) != 2 or not (c[0].isnumeric() and c[1].isnumeric()):
+            return 'Incorrect input, input must be positve #,#, Info or Quit'
+        elif not 0 < int(c[0]) <= self.number_of_stools:
+            return 'Error ' + c[0] + ' is not within the range'
+        elif not 0 < int(c[1]) <= self.number_of_stools:
+            return 'Error ' + c[1] + ' is not within the range'
+        source = stools[int(c[0]) - 1]
+        if len(source) == 1:
+            return 'stool ' + str(int(c[0]) - 1) + ' has No cheese!'
+        pair = pairs[b'%d,%d' % (int(c[0]), int(c[1]))]
+        if not pair:
+            return 'Error, cheese cannot be moved to same stool,Try Again'
+        destination, code = pair[1], pair[2]
+        if source[-1] > destination[-1]:
+            return ('Error, cheese being moved is bigger than cheese at '
+                    'stool,Try Again!')
+        destination.append(source.pop())
+        record(code)
+        return None
+
+    def _set_configuration(self, stools, moves):
+        """ Replace self.toah by a model with the cheeses of stools, which
+        are lists of sizes above a bottom sentinel, and the move sequence
+        moves.
+
+        @param ConsoleController self:
+        @param list[list[int]] stools:
+        @param MoveSequence moves:
+        @rtype: None
+        """
+        self.toah = TOAHModel(self.number_of_stools)
+        for stool_index, stool in enumerate(stools):
+            for size in stool[1:]:
+                self.toah.add(Cheese(size), stool_index)
+        self.toah.set_move_seq(moves)
+        if self.instrumentation is not None:
+            self.instrumentation.attach(self.toah)
+            
             
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        import argparse
+        parser = argparse.ArgumentParser(
+            description='Play x,y / Info / Quit commands from a file or '
+                        'standard input.')
+        parser.add_argument('cheeses', type=int)
+        parser.add_argument('stools', type=int)
+        parser.add_argument('file', nargs='?',
+                            help='commands to play (default: stdin)')
+        parser.add_argument('--render-every', type=int, default=0,
+                            metavar='N', help='print the game about every '
+                                              'N commands')
+        args = parser.parse_args()
+        play = ConsoleController(args.cheeses, args.stools)
+        if args.file is None:
+            result = play.play_batch(sys.stdin, args.render_every)
+        else:
+            with open(args.file, 'rb') as f:
+                result = play.play_batch(f, args.render_every)
+        sys.exit(0 if result.error is None else 1)
     num_cheeses = input("Enter number of cheese: ")
     while not num_cheeses.isnumeric():
         print('Input needs to be numeric and positive\n')
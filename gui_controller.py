@@ -2,8 +2,10 @@
 """
 import time
 import tkinter as tk
+from collections import deque
 from gui_viewables import CheeseView, StoolView
-from toah_model import TOAHModel, IllegalMoveError
+from toah_model import TOAHModel, Cheese, IllegalMoveError
+from tour import tour_moves
 
 
 class GUIController:
@@ -13,6 +15,13 @@ class GUIController:
     @param float cheese_scale: height in pixels to scale
         cheese height
     @param root tk.Tk: tkinter root window
+    @param int frame_ms: milliseconds between animation frames
+    @param int move_ms: milliseconds a cheese takes to slide to its stool
+
+    Animations, and autoplay of the solver, run on the Tk event loop
+    through root.after, so the window stays responsive. Clicks that arrive
+    while a cheese is sliding or blinking are queued, and handled once the
+    animation ends; clicks during autoplay are ignored.
     """
 
     def __init__(self, number_of_cheeses, number_of_stools, content_width,
@@ -35,7 +44,13 @@ class GUIController:
         self._model = TOAHModel(number_of_stools)
         self._stools = []
         self._cheese_to_move = None
-        self._blinking = False
+        self._animating = False
+        # clicks received during an animation, oldest first
+        self._pending_clicks = deque(maxlen=16)
+        # the move iterator being autoplayed, if any
+        self._autoplay = None
+        self.frame_ms = 15
+        self.move_ms = 250
         self._number_of_stools = number_of_stools
         self.cheese_scale = cheese_scale
         self.root = tk.Tk()
@@ -43,9 +58,17 @@ class GUIController:
                            background="blue",
                            width=content_width, height=content_height)
         canvas.pack(expand=True, fill=tk.BOTH)
-        self.moves_label = tk.Label(self.root)
+        # one click handler for the whole canvas, which finds the clicked
+        # view by its canvas item index
+        self._views = {}
+        canvas.bind('<ButtonRelease>', self._canvas_clicked)
+        status = tk.Frame(self.root)
+        status.pack()
+        self.moves_label = tk.Label(status)
         self.show_number_of_moves()
-        self.moves_label.pack()
+        self.moves_label.pack(side=tk.LEFT)
+        self.rate_label = tk.Label(status)
+        self.rate_label.pack(side=tk.LEFT)
         # the dimensions of a stool are the same as a cheese that's
         # one size bigger than the biggest of the number_of_cheeses cheeses.
         for stool_ind in range(number_of_stools):
@@ -57,8 +80,10 @@ class GUIController:
                               canvas,
                               self.cheese_scale,
                               x_cent,
-                              y_cent)
+                              y_cent,
+                              stool_ind)
             self._stools.append(stool)
+            self._views[stool.index] = stool
         # Can't use self._model.fill_first_stool because we need to
         # use CheeseView objects instead of just Cheese objects.
         total_size = self.cheese_scale
@@ -75,30 +100,53 @@ class GUIController:
                                 x_cent,
                                 y_cent)
             self._model.add(cheese, 0)
+            self._views[cheese.index] = cheese
             total_size += self.cheese_scale
 
+    def _canvas_clicked(self, event):
+        """ React to a click on the canvas by reporting it to the clicked
+        view, if any.
+
+        @param GUIController self:
+        @param tk.Event event:
+        @rtype: None
+        """
+        for index in event.widget.find_withtag(tk.CURRENT):
+            view = self._views.get(index)
+            if view is not None:
+                view.click_handler(view)
+
     def cheese_clicked(self, cheese):
-        """ React to cheese being clicked: if not in the middle of blinking
-        then select cheese for moving, or for moving onto.
+        """ React to cheese being clicked: select cheese for moving, or for
+        moving onto, once any running animation is over. Ignored during
+        autoplay.
 
         @param GUIController self:
         @param CheeseView cheese:
             clicked cheese
         @rtype: None
         """
-        if not self._blinking:
+        if self._autoplay is not None:
+            return
+        if self._animating:
+            self._pending_clicks.append((self.select_cheese, cheese))
+        else:
             self.select_cheese(cheese)
 
     def stool_clicked(self, stool):
-        """ React to cheese being clicked: if not in the middle of blinking
-        then select cheese for moving, or for moving onto.
+        """ React to stool being clicked: select stool for moving onto,
+        once any running animation is over. Ignored during autoplay.
 
         @param GUIController self:
         @param StoolView stool:
             clicked stool
         @rtype: None
         """
-        if not self._blinking:
+        if self._autoplay is not None:
+            return
+        if self._animating:
+            self._pending_clicks.append((self.select_stool, stool))
+        else:
             self.select_stool(stool)
 
     def select_cheese(self, cheese):
@@ -116,8 +164,7 @@ class GUIController:
             clicked cheese
         @rtype: None
         """
-        stool = self._stools[self._model.get_cheese_location(cheese)]
-        stool_index = self.stool_index(stool)
+        stool_index = self._model.get_cheese_location(cheese)
         cheese = self._model.get_top_cheese(stool_index)
         # print(stool, stool_index, cheese)
         if self._cheese_to_move is None:
@@ -143,10 +190,9 @@ class GUIController:
         @rtype: None
         """
         if self._cheese_to_move is not None:
-            origin_stool = self._stools[
-                self._model.get_cheese_location(self._cheese_to_move)]
-            dest_stool_index = self.stool_index(dest_stool)
-            origin_stool_index = self.stool_index(origin_stool)
+            origin_stool_index = self._model.get_cheese_location(
+                self._cheese_to_move)
+            dest_stool_index = dest_stool.stool_index
             if origin_stool_index != dest_stool_index:
                 top_cheese = self._model.get_top_cheese(dest_stool_index)
                 if top_cheese is None:
@@ -158,32 +204,206 @@ class GUIController:
         """ Show the cheese move on screen, and update the model.
 
         Change self._cheese_to_move's coordinates so that it's on top of
-        platform.
+        platform, sliding it there on the event loop. An illegal move
+        blinks the cheese instead.
 
         @param GUIController self:
         @param PlatformView platform:
         @param int stool_index:
         @rtype: None
         """
-        if self._cheese_to_move is not None:
+        cheese = self._cheese_to_move
+        if cheese is not None:
+            self._cheese_to_move = None
             try:
-                from_stool = self._model.get_cheese_location(
-                    self._cheese_to_move)
+                from_stool = self._model.get_cheese_location(cheese)
                 self._model.move(from_stool, stool_index)
-                self._cheese_to_move.place(platform.x_center, platform.y_center
-                                           - self.cheese_scale)
-                self.show_number_of_moves()
             except IllegalMoveError as e:
                 print(e)
-                self._blinking = True
-                for i in range(10):
-                    self._cheese_to_move.highlight(i % 2 != 0)
-                    self.root.update()
-                    time.sleep(0.1)
-                self._blinking = False
+                self._blink(cheese, 10)
+                return
+            cheese.highlight(False)
+            self.show_number_of_moves()
+            self._slide(cheese, platform.x_center,
+                        platform.y_center - self.cheese_scale)
+
+    def _blink(self, cheese, times):
+        """ Flash cheese times times, 100ms apart, without blocking.
+
+        @param GUIController self:
+        @param CheeseView cheese:
+        @param int times:
+        @rtype: None
+        """
+        self._animating = True
+
+        def tick(i):
+            if i < times:
+                cheese.highlight(i % 2 != 0)
+                self.root.after(100, tick, i + 1)
+            else:
+                cheese.highlight(False)
+                self._animation_done()
+        tick(0)
+
+    def _slide(self, cheese, x_center, y_center):
+        """ Move cheese up, across and down onto (x_center, y_center) over
+        self.move_ms milliseconds, one frame every self.frame_ms.
+
+        @param GUIController self:
+        @param CheeseView cheese:
+        @param float x_center:
+        @param float y_center:
+        @rtype: None
+        """
+        self._animating = True
+        lift = self.cheese_scale / 2
+        path = [(cheese.x_center, cheese.y_center),
+                (cheese.x_center, lift), (x_center, lift),
+                (x_center, y_center)]
+        lengths = [abs(x1 - x0) + abs(y1 - y0)
+                   for (x0, y0), (x1, y1) in zip(path, path[1:])]
+        total = sum(lengths) or 1
+        start = time.perf_counter()
+
+        def frame():
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            progress = min(1.0, elapsed_ms / self.move_ms) \
+                if self.move_ms > 0 else 1.0
+            travelled = total * progress
+            for (x0, y0), (x1, y1), length in zip(path, path[1:], lengths):
+                if length and travelled <= length:
+                    part = travelled / length
+                    cheese.place(x0 + (x1 - x0) * part,
+                                 y0 + (y1 - y0) * part)
+                    break
+                travelled -= length
+            if progress < 1.0:
+                self.root.after(self.frame_ms, frame)
+            else:
+                cheese.place(x_center, y_center)
+                self._animation_done()
+        frame()
+
+    def _animation_done(self):
+        """ End the running animation and handle the clicks queued during
+        it, until one of them starts another animation. Autoplay ends only
+        through stop_autoplay.
+
+        @param GUIController self:
+        @rtype: None
+        """
+        if self._autoplay is not None:
+            return
+        self._animating = False
+        while self._pending_clicks and not self._animating:
+            handler, view = self._pending_clicks.popleft()
+            handler(view)
+
+    def autoplay(self, moves_per_second=4.0, moves=None):
+        """ Play moves at moves_per_second, on the event loop.
+
+        moves defaults to the solver's tour of every cheese from the first
+        stool to the last, so the cheeses should all be on the first stool.
+        Each frame applies the moves that are due to the model, then places
+        every cheese that moved once, at its final position for that frame;
+        at high speeds the positions in between are skipped. The work of a
+        frame is capped at about frame_ms, so the window stays responsive
+        when the requested speed can't be met, and rate_label shows the
+        speed actually reached. If a cheese is sliding or blinking,
+        autoplay starts once it is done, instead of any queued clicks.
+        Autoplay stops at the first move that is illegal, names a stool
+        that doesn't exist, or is not a pair of stool indices.
+
+        @param GUIController self:
+        @param float moves_per_second:
+        @param iterable[tuple[int]]|None moves:
+        @rtype: None
+        """
+        if self._animating and self._autoplay is None:
+            self._pending_clicks.clear()
+            self._pending_clicks.append(
+                (lambda _: self.autoplay(moves_per_second, moves), None))
+            return
+        self.stop_autoplay()
+        self._pending_clicks.clear()
+        if moves is None:
+            moves = tour_moves(self._model.get_number_of_cheeses(),
+                               self._number_of_stools)
+        moves = iter(moves)
+        if self._cheese_to_move is not None:
             self._cheese_to_move.highlight(False)
             self._cheese_to_move = None
-            self.root.update()
+        self._animating = True
+        self._autoplay = moves
+        model, stools, scale = self._model, self._stools, self.cheese_scale
+        number_of_stools = len(stools)
+        heights = [0] * number_of_stools
+        for size in range(1, model.get_number_of_cheeses() + 1):
+            heights[model.get_cheese_location(Cheese(size))] += 1
+        clock = time.perf_counter
+        start = rate_start = clock()
+        played = rate_played = 0
+
+        def frame():
+            nonlocal played, rate_start, rate_played
+            if self._autoplay is not moves:
+                return
+            now = clock()
+            deadline = now + self.frame_ms / 1000
+            due = int((now - start) * moves_per_second) - played
+            # final position of each cheese moved in this frame
+            placed = {}
+            finished = False
+            for _ in range(due):
+                try:
+                    src, dst = next(moves)
+                    if not (0 <= src < number_of_stools and
+                            0 <= dst < number_of_stools):
+                        raise IllegalMoveError('No such stool in move {}'
+                                               .format((src, dst)))
+                    cheese = model.get_top_cheese(src)
+                    model.move(src, dst)
+                except StopIteration:
+                    finished = True
+                    break
+                except (IllegalMoveError, TypeError, ValueError) as e:
+                    print(e)
+                    finished = True
+                    break
+                heights[src] -= 1
+                heights[dst] += 1
+                placed[cheese] = (stools[dst].x_center,
+                                  stools[dst].y_center - scale * heights[dst])
+                played += 1
+                if not played & 63 and clock() > deadline:
+                    break
+            for cheese, (x_center, y_center) in placed.items():
+                cheese.place(x_center, y_center)
+            if placed:
+                self.show_number_of_moves()
+            now = clock()
+            if finished or now - rate_start >= 0.5:
+                rate = (played - rate_played) / max(now - rate_start, 1e-9)
+                self.rate_label.config(text="Moves/sec: {:.0f}".format(rate))
+                rate_start, rate_played = now, played
+            if finished:
+                self.stop_autoplay()
+            else:
+                self.root.after(self.frame_ms, frame)
+        frame()
+
+    def stop_autoplay(self):
+        """ Stop autoplay, if it is running, leaving the cheeses where they
+        are.
+
+        @param GUIController self:
+        @rtype: None
+        """
+        if self._autoplay is not None:
+            self._autoplay = None
+            self._pending_clicks.clear()
+            self._animation_done()
 
     def stool_index(self, stool):
         """ Return the index of stool.
@@ -199,7 +419,7 @@ class GUIController:
         >>> gui.stool_index(s) == 1
         False
         """
-        return self._stools.index(stool)
+        return stool.stool_index
 
     def show_number_of_moves(self):
         """Show the number of moves so far.
@@ -14,7 +14,9 @@ CheeseView objects can be moved and highlighted.
 Note that CheeseView inherits from both Cheese and PlatformView
 
 PlatformView objects receive a function to call in order to report to some
-UI object (e.g. GUIController) that their rectangle was clicked on.
+UI object (e.g. GUIController) that their rectangle was clicked on. The UI
+object binds a single click handler to the whole canvas, finds the clicked
+PlatformView by its canvas item index, and calls its click_handler.
 """
 
 
@@ -28,6 +30,9 @@ class PlatformView:
     === Attributes ===
     @param Canvas canvas: tkinter class for drawing
     @param float thickness: vertical extent of platform
+    @param int index: canvas item index of the platform's rectangle
+    @param function click_handler: function to call with this platform
+        when it is clicked
     """
 
     def __init__(self, width, click_handler, canvas,
@@ -50,6 +55,7 @@ class PlatformView:
         """
 
         self.canvas = canvas
+        self.click_handler = click_handler
         self._width = width
         self.x_center = x_center
         self.y_center = y_center
@@ -63,13 +69,6 @@ class PlatformView:
         # Initial placement.
         self.place(x_center, y_center)
 
-        # Tell the canvas to report when the rectangle is clicked.
-        # The report is a call to click_handler, passing it this CheeseView
-        # instance so the controller knows which one was clicked.
-        self.canvas.tag_bind(self.index,
-                             '<ButtonRelease>',
-                             lambda _: click_handler(self))
-
     def place(self, x_center, y_center):
         """ Place rectangular image of this cheese/stool at (x_center, y_center)
 
@@ -134,10 +133,13 @@ class CheeseView(Cheese, PlatformView):
 
 class StoolView(PlatformView):
     """ A visible Stool
+
+    === Attributes ===
+    @param int|None stool_index: index of this stool in its model
     """
 
     def __init__(self, width, click_handler, canvas, thickness,
-                 x_center, y_center):
+                 x_center, y_center, stool_index=None):
         """ Create a new StoolView
 
         @type self: StoolView
@@ -147,9 +149,11 @@ class StoolView(PlatformView):
         @type thickness: float
         @type x_center: float
         @type y_center: float
+        @type stool_index: int|None
         """
         PlatformView.__init__(self, width, click_handler, canvas, thickness,
                               x_center, y_center)
+        self.stool_index = stool_index
         self.canvas.itemconfigure(self.index, fill='black')
 
 
@@ -0,0 +1,149 @@
+"""
+BatchGames: Many independent TOAH games simulated at once with NumPy.
+
+Each game keeps one 64-bit mask per stool, with bit c set when the
+(c+1)-th smallest cheese is on that stool, so the top cheese of a stool is
+its lowest set bit. A step applies one move to every game with a handful
+of whole-array operations: a move is legal when its source stool is not
+empty and its lowest bit is below that of the destination (or the
+destination is empty). Illegal moves are left unapplied and flagged in the
+returned mask.
+
+Requires NumPy, and at most 64 cheeses and 256 stools per game.
+"""
+
+import numpy as np
+from toah_model import TOAHModel, Cheese, MoveSequence
+
+
+class BatchGames:
+    """ A batch of TOAH games that all start with a full first stool.
+
+    === Attributes ===
+    @param int number_of_games: games in the batch
+    @param int number_of_stools: stools in every game
+    @param int number_of_cheeses: cheeses in every game
+    @param numpy.ndarray number_of_moves: legal moves applied per game
+    @param numpy.ndarray number_of_errors: illegal moves rejected per game
+    """
+
+    def __init__(self, number_of_games, number_of_stools, number_of_cheeses,
+                 record=True):
+        """ Create a new batch of games in their starting configuration.
+
+        @param BatchGames self:
+        @param int number_of_games:
+        @param int number_of_stools:
+        @param int number_of_cheeses:
+        @param bool record: keep every step, for move_sequence
+        @rtype: None
+        """
+        if number_of_cheeses > 64:
+            raise ValueError('BatchGames holds at most 64 cheeses')
+        if number_of_stools > 256:
+            raise ValueError('BatchGames holds at most 256 stools')
+        self.number_of_games = number_of_games
+        self.number_of_stools = number_of_stools
+        self.number_of_cheeses = number_of_cheeses
+        self._full = np.uint64((1 << number_of_cheeses) - 1)
+        self._stools = np.zeros((number_of_games, number_of_stools),
+                                dtype=np.uint64)
+        self._stools[:, 0] = self._full
+        self._games = np.arange(number_of_games)
+        self.number_of_moves = np.zeros(number_of_games, dtype=np.int64)
+        self.number_of_errors = np.zeros(number_of_games, dtype=np.int64)
+        # per step: (src, dst, legal) arrays, when recording
+        self._history = [] if record else None
+
+    def step(self, src, dst):
+        """ Apply move (src[g], dst[g]) to every game g and return the mask
+        of games whose move was illegal and so not applied.
+
+        src and dst may also be single stool numbers shared by all games.
+
+        @param BatchGames self:
+        @param numpy.ndarray|int src:
+        @param numpy.ndarray|int dst:
+        @rtype: numpy.ndarray
+
+        >>> games = BatchGames(2, 3, 2)
+        >>> games.step(np.array([0, 0]), np.array([1, 1])).tolist()
+        [False, False]
+        >>> games.step(np.array([0, 1]), np.array([1, 1])).tolist()
+        [True, True]
+        >>> games.number_of_moves.tolist()
+        [1, 1]
+        """
+        n = self.number_of_games
+        src = np.broadcast_to(np.asarray(src, dtype=np.int64), (n,))
+        dst = np.broadcast_to(np.asarray(dst, dtype=np.int64), (n,))
+        valid = ((src >= 0) & (src < self.number_of_stools) & (dst >= 0) &
+                 (dst < self.number_of_stools) & (src != dst))
+        s = np.where(valid, src, 0)
+        d = np.where(valid, dst, 0)
+        source = self._stools[self._games, s]
+        destination = self._stools[self._games, d]
+        top = source & (~source + np.uint64(1))
+        below = destination & (~destination + np.uint64(1))
+        legal = valid & (source != 0) & ((destination == 0) | (top < below))
+        moved = np.where(legal, top, np.uint64(0))
+        self._stools[self._games, s] = source ^ moved
+        self._stools[self._games, d] = \
+            self._stools[self._games, d] | moved
+        self.number_of_moves += legal
+        self.number_of_errors += ~legal
+        if self._history is not None:
+            self._history.append((src.astype(np.uint8), dst.astype(np.uint8),
+                                  legal))
+        return ~legal
+
+    def solved(self):
+        """ Return the mask of games with every cheese on the last stool.
+
+        @param BatchGames self:
+        @rtype: numpy.ndarray
+
+        >>> games = BatchGames(1, 3, 1)
+        >>> _ = games.step(0, 2)
+        >>> games.solved().tolist()
+        [True]
+        """
+        return self._stools[:, -1] == self._full
+
+    def to_model(self, game):
+        """ Return a TOAHModel in the current configuration of game.
+
+        The model's move sequence is empty; see move_sequence.
+
+        @param BatchGames self:
+        @param int game:
+        @rtype: TOAHModel
+
+        >>> games = BatchGames(1, 3, 2)
+        >>> _ = games.step(0, 1)
+        >>> replayed = games.move_sequence(0).generate_toah_model(3, 2)
+        >>> games.to_model(0) == replayed
+        True
+        """
+        model = TOAHModel(self.number_of_stools)
+        masks = [int(mask) for mask in self._stools[game]]
+        for cheese in range(self.number_of_cheeses - 1, -1, -1):
+            for stool_index, mask in enumerate(masks):
+                if mask >> cheese & 1:
+                    model.add(Cheese(cheese + 1), stool_index)
+        return model
+
+    def move_sequence(self, game):
+        """ Return the legal moves applied to game so far.
+
+        @param BatchGames self:
+        @param int game:
+        @rtype: MoveSequence
+        """
+        if self._history is None:
+            raise ValueError('this batch does not record its moves')
+        moves = MoveSequence([])
+        for src, dst, legal in self._history:
+            if legal[game]:
+                moves.add_move(int(src[game]), int(dst[game]))
+        return moves
@@ -0,0 +1,228 @@
+"""
+TourCache: Solved tours kept in memory and on disk, keyed by the numbers
+of cheeses and stools.
+
+The memory tier is a least-recently-used dict of MoveSequences. The disk
+tier keeps one game file (see toah_file) per tour in a directory, which
+other processes may share; files are written atomically, touched when
+read, and the least recently used are removed once the directory holds
+more than a given number of bytes.
+"""
+
+import os
+import tempfile
+from collections import OrderedDict
+from toah_file import MoveFile, MoveWriter
+from tour import tour_move_sequence, split_table
+
+
+class TourCache:
+    """ A two-tier cache of tour MoveSequences.
+
+    MoveSequences returned by get are shared with the cache, and must not
+    be modified.
+
+    === Attributes ===
+    @param str|None directory: where the disk tier keeps its files, or None
+        for a memory-only cache
+    @param int memory_size: most tours kept in memory
+    @param int disk_bytes: most bytes of files kept in directory
+    @param int hits: lookups answered from memory
+    @param int disk_hits: lookups answered from disk
+    @param int misses: lookups that had to solve the tour
+    @param int evictions: tours dropped from memory or disk
+    """
+
+    def __init__(self, directory=None, memory_size=16, disk_bytes=1 << 30):
+        """ Create a new, empty TourCache.
+
+        @param TourCache self:
+        @param str|None directory:
+        @param int memory_size:
+        @param int disk_bytes:
+        @rtype: None
+        """
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, number_of_cheeses, number_of_stools=4):
+        """ Return the tour of number_of_cheeses cheeses from the first to
+        the last of number_of_stools stools.
+
+        @param TourCache self:
+        @param int number_of_cheeses:
+        @param int number_of_stools:
+        @rtype: MoveSequence
+
+        >>> import tour
+        >>> cache = TourCache(tempfile.mkdtemp())
+        >>> cache.get(5) == tour.tour_move_sequence(5, 4)
+        True
+        >>> cache.get(5) is cache.get(5)
+        True
+        >>> TourCache(cache.directory).get(5).length()
+        13
+        >>> cache.stats()
+        {'hits': 2, 'disk_hits': 0, 'misses': 1, 'evictions': 0}
+        """
+        key = (number_of_cheeses, number_of_stools)
+        moves = self._memory.get(key)
+        if moves is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return moves
+        moves = self._load(key)
+        if moves is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            moves = tour_move_sequence(number_of_cheeses, number_of_stools)
+            self._store(key, moves)
+        self._memory[key] = moves
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+        return moves
+
+    def stats(self):
+        """ Return the hit and miss counters of self.
+
+        @param TourCache self:
+        @rtype: dict
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def clear(self):
+        """ Forget every cached tour, in memory and on disk.
+
+        @param TourCache self:
+        @rtype: None
+        """
+        self._memory.clear()
+        for name in self._files():
+            _remove(os.path.join(self.directory, name))
+
+    def _path(self, key):
+        """ Return the path of the disk tier's file for key.
+
+        @param TourCache self:
+        @param tuple[int] key:
+        @rtype: str
+        """
+        return os.path.join(self.directory, 'tour-{}x{}.toah'.format(*key))
+
+    def _files(self):
+        """ Return the names of the disk tier's files.
+
+        @param TourCache self:
+        @rtype: list[str]
+        """
+        if self.directory is None:
+            return []
+        return [name for name in os.listdir(self.directory)
+                if name.startswith('tour-') and name.endswith('.toah')]
+
+    def _load(self, key):
+        """ Return the tour for key from disk, or None if it isn't there.
+
+        A file that cannot be read, or that does not hold a tour of the
+        right length, is removed, and the tour is solved again.
+
+        @param TourCache self:
+        @param tuple[int] key:
+        @rtype: MoveSequence|None
+
+        >>> cache = TourCache(tempfile.mkdtemp())
+        >>> moves = cache.get(6, 3)
+        >>> path = cache._path((6, 3))
+        >>> with open(path, 'rb') as f:
+        ...     data = f.read()
+        >>> for damaged in [data[:-3], data[:6], b'']:
+        ...     with open(path, 'wb') as f:
+        ...         _ = f.write(damaged)
+        ...     print(TourCache(cache.directory)._load((6, 3)),
+        ...           os.path.exists(path))
+        None False
+        None False
+        None False
+        >>> TourCache(cache.directory).get(6, 3) == moves
+        True
+        """
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        n, k = key
+        try:
+            with MoveFile(path) as f:
+                if (f.number_of_cheeses, f.number_of_stools) != key:
+                    raise ValueError('{} holds another tour'.format(path))
+                if f.number_of_moves != split_table(n, k)[0][n]:
+                    raise ValueError('{} holds {} moves, not a tour'
+                                     .format(path, f.number_of_moves))
+                moves = f.move_sequence()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # a damaged file is solved again
+            _remove(path)
+            return None
+        os.utime(path)
+        return moves
+
+    def _store(self, key, moves):
+        """ Write the tour for key to disk, then evict the least recently
+        used files while the directory holds more than disk_bytes.
+
+        @param TourCache self:
+        @param tuple[int] key:
+        @param MoveSequence moves:
+        @rtype: None
+        """
+        if self.directory is None:
+            return
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            with MoveWriter(f, key[1], key[0]) as writer:
+                writer.write_moves(moves)
+        if os.path.getsize(temporary) > self.disk_bytes:
+            _remove(temporary)
+            return
+        os.replace(temporary, self._path(key))
+        files = []
+        for name in self._files():
+            try:
+                status = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((status.st_mtime, status.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.disk_bytes:
+                break
+            _remove(os.path.join(self.directory, name))
+            total -= size
+            self.evictions += 1
+
+
+def _remove(path):
+    """ Remove the file at path, if it still exists.
+
+    @param str path:
+    @rtype: None
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
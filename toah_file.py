@@ -0,0 +1,516 @@
+"""
+MoveWriter, MoveFile: Compact binary files of TOAH games.
+
+A file holds a game's stools and cheeses, an optional start configuration,
+and a sequence of moves. Writing is streaming, and reading goes through
+mmap, so files much larger than memory can be iterated or replayed.
+
+File layout (little-endian):
+    4 bytes   magic b'TOAH'
+    2 bytes   format version (1)
+    2 bytes   number of stools k
+    4 bytes   number of cheeses n: the size of the largest cheese
+    8 bytes   number of moves, or 2 ** 64 - 1 if the writer could not
+              seek back to fill it in
+    1 byte    flags: bit 0 set if a start configuration follows
+    [n locations, one byte each (two if k > 255): the stool of each cheese,
+              smallest first, with all bits set for a size that is absent]
+    moves, each the varint (7 bits per byte, low bits first, high bit set
+              on all but the last byte) of src * k + dst
+
+Without a start configuration, the game starts with every cheese on the
+first stool. With up to 11 stools every move is one byte, and whole
+sections are converted to and from MoveSequence's packing with
+bytes.translate. Consecutive moves of a game never repeat, so runs of equal
+moves are not coded specially.
+"""
+
+import mmap
+import struct
+from toah_model import TOAHModel, Cheese, IllegalMoveError, MoveSequence
+
+_MAGIC = b'TOAH'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHHIQB')
+_COUNT_OFFSET = 12
+_UNKNOWN = (1 << 64) - 1
+_HAS_START = 1
+_CHUNK = 1 << 20
+
+
+def _byte_tables(number_of_stools):
+    """ Return the translation tables between MoveSequence's one-byte
+    packing (src << 4 | dst) and one-byte file codes (src * k + dst), for
+    k = number_of_stools <= 11. Bytes that are not a valid move translate
+    to 0xff.
+
+    @param int number_of_stools:
+    @rtype: tuple[bytes]
+    """
+    k = number_of_stools
+    to_file, from_file = bytearray(b'\xff' * 256), bytearray(b'\xff' * 256)
+    for s in range(k):
+        for d in range(k):
+            to_file[s << 4 | d] = s * k + d
+            from_file[s * k + d] = s << 4 | d
+    return bytes(to_file), bytes(from_file)
+
+
+class MoveWriter:
+    """ Writes a game to a file, one move or one MoveSequence at a time.
+
+    === Attributes ===
+    @param int number_of_stools: stools of the game
+    @param int number_of_cheeses: size of the largest cheese
+    @param int number_of_moves: moves written so far
+    """
+
+    def __init__(self, file, number_of_stools, number_of_cheeses,
+                 start=None):
+        """ Start writing a game to file, a path or a binary file object.
+
+        If start is given, the game starts in start's configuration, and
+        number_of_cheeses must be at least its largest cheese; otherwise
+        it starts with every cheese on the first stool.
+
+        @param MoveWriter self:
+        @param str|file file:
+        @param int number_of_stools:
+        @param int number_of_cheeses:
+        @param TOAHModel|None start:
+        @rtype: None
+        """
+        if not 0 < number_of_stools < 1 << 16:
+            raise ValueError('a file holds 1 to 65535 stools')
+        self._owns_file = not hasattr(file, 'write')
+        self._file = open(file, 'wb') if self._owns_file else file
+        self.number_of_stools = number_of_stools
+        self.number_of_cheeses = number_of_cheeses
+        self.number_of_moves = 0
+        self._buffer = bytearray()
+        self._to_file = None
+        if number_of_stools <= 11:
+            self._to_file = _byte_tables(number_of_stools)[0]
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, number_of_stools,
+                                      number_of_cheeses, _UNKNOWN,
+                                      0 if start is None else _HAS_START))
+        if start is not None:
+            self._file.write(_pack_locations(start, number_of_stools,
+                                             number_of_cheeses))
+
+    def add_move(self, src_stool, dest_stool):
+        """ Write the move from src_stool to dest_stool.
+
+        @param MoveWriter self:
+        @param int src_stool:
+        @param int dest_stool:
+        @rtype: None
+        """
+        k = self.number_of_stools
+        if not (0 <= src_stool < k and 0 <= dest_stool < k):
+            raise ValueError('No such stool in move {}'
+                             .format((src_stool, dest_stool)))
+        code = src_stool * k + dest_stool
+        while code >= 0x80:
+            self._buffer.append(code & 0x7f | 0x80)
+            code >>= 7
+        self._buffer.append(code)
+        self.number_of_moves += 1
+        if len(self._buffer) >= _CHUNK:
+            self._flush()
+
+    def write_moves(self, moves):
+        """ Write every move of moves, in order.
+
+        @param MoveWriter self:
+        @param MoveSequence|iterable[tuple[int]] moves:
+        @rtype: None
+        """
+        codes = None
+        if self._to_file is not None and isinstance(moves, MoveSequence):
+            codes = moves.packed_codes()
+        if codes is not None:
+            self._flush()
+            for start in range(0, len(codes), _CHUNK):
+                chunk = codes[start:start + _CHUNK].tobytes().translate(
+                    self._to_file)
+                if b'\xff' in chunk:
+                    raise ValueError('No such stool in move {}'.format(
+                        moves.get_move(start + chunk.index(b'\xff'))))
+                self._file.write(chunk)
+                self.number_of_moves += len(chunk)
+            codes.release()
+        else:
+            for src_stool, dest_stool in moves:
+                self.add_move(src_stool, dest_stool)
+
+    def _flush(self):
+        """ Write out the buffered moves.
+
+        @param MoveWriter self:
+        @rtype: None
+        """
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    def close(self):
+        """ Finish the file, recording the number of moves if it can be
+        sought back to.
+
+        @param MoveWriter self:
+        @rtype: None
+        """
+        self._flush()
+        if self._file.seekable():
+            end = self._file.tell()
+            self._file.seek(_COUNT_OFFSET)
+            self._file.write(struct.pack('<Q', self.number_of_moves))
+            self._file.seek(end)
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _pack_locations(model, number_of_stools, number_of_cheeses):
+    """ Return the start configuration section for model.
+
+    @param TOAHModel model:
+    @param int number_of_stools:
+    @param int number_of_cheeses:
+    @rtype: bytes
+    """
+    wide = number_of_stools > 255
+    absent = 0xffff if wide else 0xff
+    locations = [absent] * number_of_cheeses
+    for size in range(1, number_of_cheeses + 1):
+        location = model.get_cheese_location(Cheese(size))
+        if location is not None:
+            locations[size - 1] = location
+    if model.get_number_of_cheeses() != number_of_cheeses - \
+            locations.count(absent):
+        raise ValueError('start has cheeses larger than {}'
+                         .format(number_of_cheeses))
+    if wide:
+        return struct.pack('<{}H'.format(number_of_cheeses), *locations)
+    return bytes(locations)
+
+
+class MoveFile:
+    """ A game file, memory-mapped read-only.
+
+    === Attributes ===
+    @param int number_of_stools: stools of the game
+    @param int number_of_cheeses: size of the largest cheese
+    @param int number_of_moves: moves in the file
+    @param list[int|None]|None start_locations: stool of each cheese at the
+        start, smallest first (None for an absent size), or None if every
+        cheese starts on the first stool
+    """
+
+    def __init__(self, path):
+        """ Open the game file at path.
+
+        Raise ValueError if the file is not a whole TOAH game file.
+
+        @param MoveFile self:
+        @param str path:
+        @rtype: None
+
+        >>> import os, tempfile
+        >>> from tour import tour_move_sequence
+        >>> path = os.path.join(tempfile.mkdtemp(), 'moves.toah')
+        >>> with MoveWriter(path, 3, 6) as writer:
+        ...     writer.write_moves(tour_move_sequence(6, 3))
+        >>> with open(path, 'rb') as f:
+        ...     data = f.read()
+        >>> with open(path, 'wb') as f:
+        ...     _ = f.write(data[:-3])
+        >>> MoveFile(path)  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        ValueError: ... records 63 moves but holds 60
+        >>> with open(path, 'wb') as f:
+        ...     _ = f.write(data[:6])
+        >>> MoveFile(path)  # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        ValueError: ... is too short for a TOAH game file
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header(path)
+        except struct.error:
+            self._map.close()
+            raise ValueError('{} is too short for a TOAH game file'
+                             .format(path)) from None
+        except BaseException:
+            self._map.close()
+            raise
+
+    def _read_header(self, path):
+        """ Read the header and start configuration of the file at path,
+        and count its moves.
+
+        Raise ValueError if the file is damaged, or struct.error if it ends
+        inside the header.
+
+        @param MoveFile self:
+        @param str path:
+        @rtype: None
+        """
+        magic, version, k, n, count, flags = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError('{} is not a TOAH game file'.format(path))
+        if version != _VERSION:
+            raise ValueError('{} has unknown format version {}'
+                             .format(path, version))
+        self.number_of_stools = k
+        self.number_of_cheeses = n
+        self.start_locations = None
+        self._offset = _HEADER.size
+        if flags & _HAS_START:
+            if k > 255:
+                width, absent = 2, 0xffff
+                locations = struct.unpack_from('<{}H'.format(n), self._map,
+                                               self._offset)
+            else:
+                width, absent = 1, 0xff
+                locations = self._map[self._offset:self._offset + n]
+                if len(locations) < n:
+                    raise struct.error('start configuration is cut short')
+            self.start_locations = [None if location == absent else location
+                                    for location in locations]
+            self._offset += width * n
+        if len(self._map) > self._offset and self._map[-1] & 0x80:
+            raise ValueError('{} ends in the middle of a move'.format(path))
+        # every move ends in its one byte without the high bit set, counted
+        # a chunk at a time so the moves are never all loaded
+        high = bytes(range(0x80, 0x100))
+        moves = sum(len(chunk.translate(None, high))
+                    for chunk in self._chunks())
+        if count != _UNKNOWN and count != moves:
+            raise ValueError('{} records {} moves but holds {}'
+                             .format(path, count, moves))
+        self.number_of_moves = moves
+
+    def close(self):
+        """ Unmap the file.
+
+        @param MoveFile self:
+        @rtype: None
+        """
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _chunks(self):
+        """ Yield the moves section in chunks that end between moves.
+
+        @param MoveFile self:
+        @rtype: generator[bytes]
+        """
+        position, end = self._offset, len(self._map)
+        while position < end:
+            chunk = self._map[position:position + _CHUNK]
+            if position + len(chunk) < end:
+                # stop after the last byte that ends a move
+                last = len(chunk) - 1
+                while chunk[last] & 0x80:
+                    last -= 1
+                chunk = chunk[:last + 1]
+            position += len(chunk)
+            yield chunk
+
+    def __iter__(self):
+        """ Return an iterator over the (src, dest) moves of the file.
+
+        @param MoveFile self:
+        @rtype: iterator[tuple[int]]
+        """
+        k = self.number_of_stools
+        pairs = [divmod(code, k) for code in range(min(k * k, 0x80))]
+        for chunk in self._chunks():
+            if k <= 11:
+                yield from map(pairs.__getitem__, chunk)
+            else:
+                yield from _decode_varints(chunk, k)
+
+    def move_sequence(self):
+        """ Return every move of the file as a MoveSequence.
+
+        @param MoveFile self:
+        @rtype: MoveSequence
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'moves.toah')
+        >>> with MoveWriter(path, 3, 2) as writer:
+        ...     writer.write_moves(MoveSequence([(0, 1), (0, 2)]))
+        ...     writer.add_move(1, 2)
+        >>> with MoveFile(path) as f:
+        ...     f.number_of_moves, f.move_sequence()
+        (3, [(0, 1), (0, 2), (1, 2)])
+        """
+        if self.number_of_stools > 11:
+            return MoveSequence(self)
+        from_file = _byte_tables(self.number_of_stools)[1]
+        moves = MoveSequence([])
+        for chunk in self._chunks():
+            codes = chunk.translate(from_file)
+            if b'\xff' in codes:
+                raise ValueError('move {} is not valid'.format(
+                    moves.length() + codes.index(b'\xff')))
+            moves.extend_packed(codes)
+        return moves
+
+    def start_model(self):
+        """ Return a TOAHModel in the start configuration of the file.
+
+        @param MoveFile self:
+        @rtype: TOAHModel
+        """
+        model = TOAHModel(self.number_of_stools)
+        if self.start_locations is None:
+            model.fill_first_stool(self.number_of_cheeses)
+        else:
+            for size in range(self.number_of_cheeses, 0, -1):
+                location = self.start_locations[size - 1]
+                if location is not None:
+                    model.add(Cheese(size), location)
+        return model
+
+    def to_model(self):
+        """ Return a TOAHModel in the configuration reached after every
+        move of the file. Moves are replayed a chunk at a time on plain
+        lists of cheese sizes, and the model's move sequence is empty.
+
+        @param MoveFile self:
+        @rtype: TOAHModel
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'game.toah')
+        >>> start = TOAHModel(3)
+        >>> start.add(Cheese(3), 2)
+        >>> start.add(Cheese(1), 2)
+        >>> with MoveWriter(path, 3, 3, start) as writer:
+        ...     writer.write_moves([(2, 0), (2, 1), (0, 1)])
+        >>> with MoveFile(path) as f:
+        ...     f.start_locations, f.to_model() == f.start_model()
+        ([2, None, 2], False)
+        >>> expected = TOAHModel(3)
+        >>> expected.add(Cheese(3), 1)
+        >>> expected.add(Cheese(1), 1)
+        >>> with MoveFile(path) as f:
+        ...     f.to_model() == expected
+        True
+        """
+        k, n = self.number_of_stools, self.number_of_cheeses
+        # every stool keeps a bottom cheese larger than any real one
+        bottom = n + 1
+        stools = [[bottom] for _ in range(k)]
+        start = self.start_model()
+        for size in range(n, 0, -1):
+            location = start.get_cheese_location(Cheese(size))
+            if location is not None:
+                stools[location].append(size)
+        pairs = [(stools[s], stools[d]) for s in range(k) for d in range(k)]
+        position = 0
+        for codes in self._code_chunks():
+            if codes and max(codes) >= k * k:
+                raise ValueError('the file holds a move that is not valid')
+            for index, code in enumerate(codes, position):
+                source, destination = pairs[code]
+                if source[-1] >= destination[-1]:
+                    raise IllegalMoveError('Illegal move {} at position {}'
+                                           .format(divmod(code, k), index))
+                destination.append(source.pop())
+            position += len(codes)
+        model = TOAHModel(k)
+        for stool_index, stool in enumerate(stools):
+            for size in stool[1:]:
+                model.add(Cheese(size), stool_index)
+        return model
+
+    def _code_chunks(self):
+        """ Yield the src * k + dst codes of the moves of the file, a chunk
+        at a time.
+
+        @param MoveFile self:
+        @rtype: generator[bytes|list[int]]
+        """
+        k = self.number_of_stools
+        for chunk in self._chunks():
+            if k <= 11:
+                yield chunk
+            else:
+                yield [src * k + dst
+                       for src, dst in _decode_varints(chunk, k)]
+
+
+def _decode_varints(chunk, number_of_stools):
+    """ Yield the moves coded in chunk, which ends between moves.
+
+    @param bytes chunk:
+    @param int number_of_stools:
+    @rtype: generator[tuple[int]]
+    """
+    code = shift = 0
+    for byte in chunk:
+        code |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield divmod(code, number_of_stools)
+            code = shift = 0
+
+
+def save_model(path, model, number_of_cheeses=None):
+    """ Write model's configuration to path as the start of a game with
+    no moves.
+
+    @param str path:
+    @param TOAHModel model:
+    @param int|None number_of_cheeses: size of the largest cheese, if
+        known
+    @rtype: None
+    """
+    if number_of_cheeses is None:
+        number_of_cheeses = max((cheese.size for stool in model._stools
+                                 for cheese in stool), default=0)
+    MoveWriter(path, model.get_number_of_stools(), number_of_cheeses,
+               model).close()
+
+
+def load_model(path):
+    """ Return the TOAHModel reached at the end of the game file at path.
+
+    @param str path:
+    @rtype: TOAHModel
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'snapshot.toah')
+    >>> M = TOAHModel(4)
+    >>> M.fill_first_stool(5)
+    >>> M.move(0, 3)
+    >>> save_model(path, M)
+    >>> load_model(path) == M
+    True
+    """
+    with MoveFile(path) as f:
+        return f.to_model()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,232 @@
+"""
+Instrumentation: Opt-in counters and latency histograms for TOAHModel.
+
+Attaching an Instrumentation to a model shadows its move, add,
+get_top_cheese and get_cheese_location methods with timed wrappers on
+that one instance. Models that are not attached run the plain class
+methods, so instrumentation costs nothing when it is not in use.
+
+Latencies are kept in power-of-two histograms: bucket b counts calls that
+took from 2 ** (b - 1) up to 2 ** b - 1 nanoseconds.
+"""
+
+import json
+import time
+from toah_model import IllegalMoveError
+
+_MODEL_METHODS = ('move', 'add', 'get_top_cheese', 'get_cheese_location')
+
+
+class _Stat:
+    """ Counters and latency histogram for one operation.
+    """
+    __slots__ = ('count', 'total_ns', 'rejected', 'histogram')
+
+    def __init__(self):
+        """ Create a new, empty _Stat.
+
+        @param _Stat self:
+        @rtype: None
+        """
+        self.count = 0
+        self.total_ns = 0
+        self.rejected = 0
+        self.histogram = [0] * 65
+
+    def record(self, elapsed_ns):
+        """ Count one call that took elapsed_ns nanoseconds.
+
+        @param _Stat self:
+        @param int elapsed_ns:
+        @rtype: None
+        """
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.histogram[min(elapsed_ns.bit_length(), 64)] += 1
+
+    def snapshot(self):
+        """ Return the counters of self as plain data.
+
+        @param _Stat self:
+        @rtype: dict
+        """
+        return {'count': self.count, 'total_ns': self.total_ns,
+                'rejected': self.rejected,
+                'histogram': {2 ** b: n for b, n in
+                              enumerate(self.histogram) if n}}
+
+
+class Instrumentation:
+    """ Counters and latency histograms for TOAHModel operations, solver
+    steps and console input.
+
+    Each operation is counted on its own: move places the cheese itself,
+    without calling add or get_top_cheese. 'between_moves' times the gap
+    from the end of one move to the start of the next, which is the work
+    a solver or player does per move.
+    """
+
+    def __init__(self):
+        """ Create a new Instrumentation with no recorded calls.
+
+        @param Instrumentation self:
+        @rtype: None
+        """
+        self._stats = {}
+        self._last_move_end = None
+
+    def _stat(self, name):
+        """ Return the _Stat for name, creating it if needed.
+
+        @param Instrumentation self:
+        @param str name:
+        @rtype: _Stat
+        """
+        if name not in self._stats:
+            self._stats[name] = _Stat()
+        return self._stats[name]
+
+    def attach(self, model):
+        """ Start recording the operations of model.
+
+        @param Instrumentation self:
+        @param TOAHModel model:
+        @rtype: None
+
+        >>> from toah_model import TOAHModel
+        >>> M = TOAHModel(3)
+        >>> M.fill_first_stool(2)
+        >>> stats = Instrumentation()
+        >>> stats.attach(M)
+        >>> M.move(0, 1)
+        >>> try:
+        ...     M.move(0, 1)
+        ... except IllegalMoveError:
+        ...     pass
+        >>> stats.detach(M)
+        >>> M.move(0, 2)
+        >>> snapshot = stats.snapshot()
+        >>> snapshot['move']['count'], snapshot['move']['rejected']
+        (2, 1)
+        >>> snapshot['add']['count']
+        0
+        """
+        for name in _MODEL_METHODS:
+            if name != 'move':
+                setattr(model, name, self.timed(getattr(model, name), name))
+        model.move = self._timed_move(model.move)
+
+    def detach(self, model):
+        """ Stop recording the operations of model.
+
+        @param Instrumentation self:
+        @param TOAHModel model:
+        @rtype: None
+        """
+        for name in _MODEL_METHODS:
+            model.__dict__.pop(name, None)
+
+    def timed(self, func, name):
+        """ Return func wrapped to record its calls under name. Calls that
+        raise IllegalMoveError are also counted as rejected.
+
+        @param Instrumentation self:
+        @param function func:
+        @param str name:
+        @rtype: function
+        """
+        stat = self._stat(name)
+        clock = time.perf_counter_ns
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            except IllegalMoveError:
+                stat.rejected += 1
+                raise
+            finally:
+                stat.record(clock() - start)
+        return wrapper
+
+    def _timed_move(self, move):
+        """ Return move wrapped like timed, also recording the time
+        between consecutive moves.
+
+        @param Instrumentation self:
+        @param function move:
+        @rtype: function
+        """
+        timed_move = self.timed(move, 'move')
+        between = self._stat('between_moves')
+        clock = time.perf_counter_ns
+
+        def wrapper(from_stool, stool_index):
+            if self._last_move_end is not None:
+                between.record(clock() - self._last_move_end)
+            try:
+                timed_move(from_stool, stool_index)
+            finally:
+                self._last_move_end = clock()
+        return wrapper
+
+    def timed_iter(self, iterable, name):
+        """ Yield from iterable, recording under name how long each item
+        took to produce, e.g. each step of a solver's move generator.
+
+        @param Instrumentation self:
+        @param iterable iterable:
+        @param str name:
+        @rtype: generator
+
+        >>> stats = Instrumentation()
+        >>> list(stats.timed_iter(iter([(0, 1)]), 'solver'))
+        [(0, 1)]
+        >>> stats.snapshot()['solver']['count']
+        1
+        """
+        stat = self._stat(name)
+        clock = time.perf_counter_ns
+        iterator = iter(iterable)
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            stat.record(clock() - start)
+            yield item
+
+    def reset(self):
+        """ Forget every recorded call.
+
+        @param Instrumentation self:
+        @rtype: None
+        """
+        for stat in self._stats.values():
+            stat.__init__()
+        self._last_move_end = None
+
+    def snapshot(self):
+        """ Return every counter and histogram as plain data, keyed by
+        operation name.
+
+        @param Instrumentation self:
+        @rtype: dict
+        """
+        return {name: stat.snapshot() for name, stat in self._stats.items()}
+
+    def export(self, path):
+        """ Write snapshot() to path as JSON.
+
+        @param Instrumentation self:
+        @param str path:
+        @rtype: None
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
@@ -6,14 +6,24 @@ MoveSequence: Record of a sequence of (not necessarily legal) moves. You will
 need to return MoveSequence object after solving an instance of the 4-stool
 Tour of Anne Hoy game, and we will use that to check the correctness of your
 algorithm.
+verify_moves: Check a sequence of moves quickly, reporting a Verification.
 """
 
+from array import array
+
 
 class TOAHModel:
     """ Model a game of Tour Of Anne Hoy.
 
     Model stools holding stacks of cheese, enforcing the constraint
     that a larger cheese may not be placed on a smaller one.
+
+    A model has a 64-bit Zobrist hash of its configuration, the XOR of a
+    random key for every (cheese size, stool) pair in it. It is computed
+    the first time the model is hashed or compared, and from then on add
+    and move update it as they go, so models that are only played pay
+    nothing for it. Models can be compared cheaply and used as dict keys
+    or set members, but must not be changed while they are.
     """
 
     def __init__(self, number_of_stools):
@@ -36,7 +46,22 @@ class TOAHModel:
         self.number_of_stools = number_of_stools
         self._move_seq = MoveSequence([])
         self._stools = [[] for stool in range(number_of_stools)]
-        
+        # cheese size -> index of the stool holding it
+        self._locations = {}
+        self._number_of_cheeses = 0
+        self._max_size = 0
+        # Zobrist hash of the configuration, or None until first needed,
+        # and the keys of each stool
+        self._hash = None
+        self._zobrist = [_stool_keys(stool_index)
+                         for stool_index in range(number_of_stools)]
+        # rendering cache for __str__: heights whose row must be redrawn,
+        # and the (number of cheeses, largest size) the rows were drawn for,
+        # or None until the first drawing, before which no rows are tracked
+        self._dirty_rows = set()
+        self._layout = None
+        self._rows = []
+        self._picture = ''
     
     def fill_first_stool(self, number_of_cheeses):
         """ fill the first stool with number of cheeses.
@@ -78,12 +103,39 @@ class TOAHModel:
         >>> m2.move(3, 2)
         >>> m1 == m2
         True
+        >>> len({m1, m2})
+        1
         """
+        if hash(self) != hash(other):
+            return False
         for index in range(len(self._stools)):
             if self._stools[index] != other._stools[index]:
                 return False
         return True
 
+    def __hash__(self):
+        """ Return the Zobrist hash of self's configuration.
+
+        @type self: TOAHModel
+        @rtype: int
+
+        >>> m1, m2 = TOAHModel(3), TOAHModel(3)
+        >>> m1.fill_first_stool(2)
+        >>> m2.fill_first_stool(2)
+        >>> m2.move(0, 1)
+        >>> hash(m1) == hash(m2)
+        False
+        >>> m2.move(1, 0)
+        >>> hash(m1) == hash(m2)
+        True
+        """
+        if self._hash is None:
+            self._hash = 0
+            for keys, stool in zip(self._zobrist, self._stools):
+                for cheese in stool:
+                    self._hash ^= keys[cheese.size]
+        return self._hash
+
     def _cheese_at(self, stool_index, stool_height):
         """ Return (stool_height)th from stool_index stool, if possible.
 
@@ -108,42 +160,61 @@ class TOAHModel:
         """
         Depicts only the current state of the stools and cheese.
 
+        Rows are cached between calls; only rows touched by add or move
+        since the last call are redrawn, unless the number of cheeses or
+        the largest cheese changed the layout.
+
+        @param TOAHModel self:
+        @rtype: str
+
+        >>> M = TOAHModel(3)
+        >>> M.fill_first_stool(2)
+        >>> M.move(0, 2)
+        >>> str(M).splitlines()[1:]
+        [' ---            -    ', '=====  =====  =====  ']
+        """
+        layout = (self._number_of_cheeses, self._max_size)
+        if layout != self._layout:
+            self._layout = layout
+            self._draw_layout()
+        elif self._dirty_rows:
+            for height in self._dirty_rows:
+                self._rows[height] = self._draw_row(height)
+        else:
+            return self._picture
+        self._dirty_rows.clear()
+        self._picture = ''.join([row + '\n' for row in reversed(self._rows)]
+                                + [self._stools_str])
+        return self._picture
+
+    def _draw_layout(self):
+        """ Rebuild the cached cheese strings and every row.
+
         @param TOAHModel self:
+        @rtype: None
+        """
+        width = 2 * self._max_size + 1
+        self._stools_str = ('=' * width + '  ') * len(self._stools)
+        # string for each cheese size, with size 0 meaning no cheese
+        self._cheese_strs = [' ' * width + '  ']
+        for size in range(1, self._max_size + 1):
+            filler = ' ' * (self._max_size - size + 1)
+            self._cheese_strs.append(filler + '-' * (2 * size - 1) + filler
+                                     + '  ')
+        self._rows = [self._draw_row(height)
+                      for height in range(self._number_of_cheeses)]
+
+    def _draw_row(self, height):
+        """ Return the picture of row height, without a line break.
+
+        @param TOAHModel self:
+        @param int height:
         @rtype: str
         """
-        all_cheeses = []
-        for height in range(self.get_number_of_cheeses()):
-            for stool in range(self.get_number_of_stools()):
-                if self._cheese_at(stool, height) is not None:
-                    all_cheeses.append(self._cheese_at(stool, height))
-        max_cheese_size = max([c.size for c in all_cheeses]) \
-            if len(all_cheeses) > 0 else 0
-        stool_str = "=" * (2 * max_cheese_size + 1)
-        stool_spacing = "  "
-        stools_str = (stool_str + stool_spacing) * self.get_number_of_stools()
-
-        def _cheese_str(size):
-            # helper for string representation of cheese
-            if size == 0:
-                return " " * len(stool_str)
-            cheese_part = "-" + "--" * (size - 1)
-            space_filler = " " * int((len(stool_str) - len(cheese_part)) / 2)
-            return space_filler + cheese_part + space_filler
-
-        lines = ""
-        for height in range(self.get_number_of_cheeses() - 1, -1, -1):
-            line = ""
-            for stool in range(self.get_number_of_stools()):
-                c = self._cheese_at(stool, height)
-                if isinstance(c, Cheese):
-                    s = _cheese_str(int(c.size))
-                else:
-                    s = _cheese_str(0)
-                line += s + stool_spacing
-            lines += line + "\n"
-        lines += stools_str
-
-        return lines
+        strs = self._cheese_strs
+        return ''.join([strs[int(stool[height].size)]
+                        if height < len(stool) else strs[0]
+                        for stool in self._stools])
 
     def add(self, cheese, stool_index):
         '''
@@ -160,15 +231,24 @@ class TOAHModel:
         >>> M.get_cheese_location(cheese)
         2
         '''
-        top_cheese = self.get_top_cheese(stool_index)
-        if self._stools[stool_index] and (cheese.size > top_cheese.size):
+        stool = self._stools[stool_index]
+        size = cheese.size
+        if stool and size > stool[-1].size:
             raise IllegalMoveError('Cannot place a larger cheese on top of a\
  smaller one')
-        self._stools[stool_index].append(cheese)
+        stool.append(cheese)
+        self._locations[size] = stool_index
+        if self._hash is not None:
+            self._hash ^= self._zobrist[stool_index][size]
+        if self._layout is not None:
+            self._dirty_rows.add(len(stool) - 1)
+        self._number_of_cheeses += 1
+        if size > self._max_size:
+            self._max_size = size
             
     def get_cheese_location(self, cheese):
         '''
-        get the location of the cheese.
+        get the location of the cheese, in constant time.
         
         @type self: TOAHModel
         @type cheese: Cheese
@@ -181,9 +261,7 @@ class TOAHModel:
         >>> M.get_cheese_location(cheese)
         2
         '''
-        for stool_index in range(len(self._stools)):
-            if cheese in self._stools[stool_index]:
-                return stool_index           
+        return self._locations.get(cheese.size)
 
     def get_top_cheese(self, stool_index):
         '''
@@ -220,13 +298,28 @@ class TOAHModel:
         >>> M.get_cheese_location(Cheese(1))
         2
         '''
-        if not self._stools[from_stool]:
+        source = self._stools[from_stool]
+        if not source:
             raise IllegalMoveError('No cheese on Stool')
         if from_stool == stool_index:
             raise IllegalMoveError('Cant place cheese back on same stool!')
-        self.add(self.get_top_cheese(from_stool), stool_index)
+        # the work of add, less the bookkeeping a move leaves unchanged
+        cheese = source[-1]
+        stool = self._stools[stool_index]
+        if stool and cheese.size > stool[-1].size:
+            raise IllegalMoveError('Cannot place a larger cheese on top of a\
+ smaller one')
+        stool.append(cheese)
+        del source[-1]
+        self._locations[cheese.size] = stool_index
         self._move_seq.add_move(from_stool, stool_index)
-        del self._stools[from_stool][-1]
+        if self._hash is not None:
+            keys = self._zobrist
+            self._hash ^= keys[stool_index][cheese.size] ^ \
+                keys[from_stool][cheese.size]
+        if self._layout is not None:
+            self._dirty_rows.add(len(stool) - 1)
+            self._dirty_rows.add(len(source))
             
     def get_move_seq(self):
         """ Return the move sequence
@@ -239,6 +332,21 @@ class TOAHModel:
         True
         """
         return self._move_seq
+
+    def set_move_seq(self, move_seq):
+        """ Make move_seq the record of the moves made on self, to which
+        later moves are added.
+
+        @type self: TOAHModel
+        @type move_seq: MoveSequence
+        @rtype: None
+
+        >>> toah = TOAHModel(3)
+        >>> toah.set_move_seq(MoveSequence([(0, 1)]))
+        >>> toah.number_of_moves()
+        1
+        """
+        self._move_seq = move_seq
     
     def number_of_moves(self):
         """Return the number of moves made.
@@ -271,11 +379,8 @@ class TOAHModel:
         >>> M.get_number_of_cheeses()
         5
         """
-        num = 0
-        for stool_index in self._stools:
-            num += len(stool_index)
-        return num
-    
+        return self._number_of_cheeses
+
     def get_number_of_stools(self):
         '''
         return the number of stools.
@@ -289,12 +394,81 @@ class TOAHModel:
         '''
         return self.number_of_stools
         
+class _ZobristKeys(dict):
+    """ Dict of cheese size -> 64-bit key for one stool, computing each key
+    the first time it is looked up.
+    """
+
+    def __init__(self, stool_index):
+        """ Create the keys of stool stool_index.
+
+        @param _ZobristKeys self:
+        @param int stool_index:
+        @rtype: None
+        """
+        super().__init__()
+        self.stool_index = stool_index
+
+    def __missing__(self, size):
+        # splitmix64 of the pair, so keys are the same in every process
+        z = ((hash(size) << 32 ^ self.stool_index) * 0x9e3779b97f4a7c15 +
+             0x632be59bd9b4e019) & 0xffffffffffffffff
+        z = (z ^ z >> 30) * 0xbf58476d1ce4e5b9 & 0xffffffffffffffff
+        z = (z ^ z >> 27) * 0x94d049bb133111eb & 0xffffffffffffffff
+        z ^= z >> 31
+        self[size] = z
+        return z
+
+
+# Zobrist keys of each stool index, shared by every TOAHModel
+_ZOBRIST = {}
+
+
+def _stool_keys(stool_index):
+    """ Return the shared Zobrist keys of stool stool_index.
+
+    @param int stool_index:
+    @rtype: _ZobristKeys
+    """
+    keys = _ZOBRIST.get(stool_index)
+    if keys is None:
+        keys = _ZOBRIST[stool_index] = _ZobristKeys(stool_index)
+    return keys
+
+
+# Shared Cheese instances, one per size.
+_CHEESES = {}
+
+
 class Cheese:
     """ A cheese for stacking in a TOAHModel
 
+    Cheese(size) returns one shared instance per size, so models built
+    from the same sizes reuse the same cheeses. Subclasses such as
+    CheeseView are not shared. A cheese's size must not change once it
+    has been created.
+
     === Attributes ===
     @param int size: width of cheese
     """
+    __slots__ = ('size',)
+
+    def __new__(cls, size, *args, **kwargs):
+        """ Return the shared Cheese of size, or a new subclass instance.
+
+        @param type cls:
+        @param int size:
+        @rtype: Cheese
+
+        >>> Cheese(3) is Cheese(3)
+        True
+        """
+        if cls is not Cheese:
+            return super().__new__(cls)
+        cheese = _CHEESES.get(size)
+        if cheese is None:
+            cheese = _CHEESES[size] = super().__new__(cls)
+        return cheese
 
     def __init__(self, size):
         """ Initialize a Cheese to diameter size.
@@ -310,7 +484,14 @@ class Cheese:
         3
         """
         self.size = size
-        
+
+    def __getnewargs__(self):
+        """ Return the arguments __new__ needs when unpickling self.
+
+        @param Cheese self:
+        @rtype: tuple[int]
+        """
+        return (self.size,)
 
     def __eq__(self, other):
         """ Is self equivalent to other?
@@ -321,8 +502,22 @@ class Cheese:
         @param Cheese self:
         @param Cheese|Any other:
         @rtype: bool
+
+        >>> Cheese(2) == Cheese(2), Cheese(2) == 2
+        (True, False)
+        """
+        return isinstance(other, Cheese) and self.size == other.size
+
+    def __hash__(self):
+        """ Return a hash consistent with __eq__.
+
+        @param Cheese self:
+        @rtype: int
+
+        >>> len({Cheese(1), Cheese(1), Cheese(2)})
+        2
         """
-        return self.size == other.size
+        return hash(self.size)
 
     def __repr__(self):
         """ Returns size of Cheese
@@ -342,8 +537,18 @@ class IllegalMoveError(Exception):
     pass
 
 
+# Packed move encodings, narrowest first: (array typecode, bits per stool).
+# A move (src, dst) is stored as src << bits | dst.
+_MOVE_ENCODINGS = (('B', 4), ('H', 8), ('L', 16))
+
+
 class MoveSequence(object):
     """ Sequence of moves in TOAH game
+
+    Moves are packed into an array, one byte per move while every stool
+    index fits in a nibble. The encoding widens automatically when a
+    larger stool index is added, and falls back to a list of tuples for
+    moves that cannot be packed (e.g. negative stool indices).
     """
 
     def __init__(self, moves):
@@ -352,9 +557,109 @@ class MoveSequence(object):
         @param MoveSequence self:
         @param list[tuple[int]] moves:
         @rtype: None
+
+        >>> MoveSequence([(0, 1), (17, 2)]).get_move(1)
+        (17, 2)
         """
         # moves - a list of integer pairs, e.g. [(0,1),(0,2),(1,2)]
-        self._moves = moves
+        self._encoding = 0
+        self._moves = array(_MOVE_ENCODINGS[0][0])
+        for src_stool, dest_stool in moves:
+            self.add_move(src_stool, dest_stool)
+
+    @classmethod
+    def from_packed(cls, codes):
+        """ Return a MoveSequence over moves already packed one per byte,
+        as src << 4 | dest.
+
+        @param type cls:
+        @param bytes|bytearray|memoryview codes:
+        @rtype: MoveSequence
+
+        >>> MoveSequence.from_packed(bytes([0x01, 0x21]))
+        [(0, 1), (2, 1)]
+        """
+        moves = cls([])
+        moves.extend_packed(codes)
+        return moves
+
+    def extend_packed(self, codes):
+        """ Add the moves packed one per byte in codes, as src << 4 | dest,
+        to the end of MoveSequence self.
+
+        The bytes are appended as they are while self packs one byte per
+        move, and added move by move once it has widened.
+
+        @param MoveSequence self:
+        @param bytes|bytearray|memoryview codes:
+        @rtype: None
+
+        >>> ms = MoveSequence([(0, 1)])
+        >>> ms.extend_packed(bytes([0x02, 0x12]))
+        >>> ms.add_move(-1, 0)
+        >>> ms.extend_packed(bytes([0x21]))
+        >>> ms
+        [(0, 1), (0, 2), (1, 2), (-1, 0), (2, 1)]
+        """
+        if self._encoding == 0:
+            self._moves.frombytes(codes)
+        else:
+            for code in bytes(codes):
+                self.add_move(code >> 4, code & 0xf)
+
+    def packed_codes(self):
+        """ Return the moves of self packed one per byte, as src << 4 |
+        dest, or None if a stool index does not fit in a nibble. The view
+        shares self's storage, and must be released before self changes.
+
+        @param MoveSequence self:
+        @rtype: memoryview|None
+
+        >>> bytes(MoveSequence([(0, 1), (2, 1)]).packed_codes())
+        b'\\x01!'
+        >>> MoveSequence([(0, 16)]).packed_codes() is None
+        True
+        """
+        if self._encoding != 0:
+            return None
+        return memoryview(self._moves)
+
+    def _widen(self, src_stool, dest_stool):
+        """ Re-encode self so that move (src_stool, dest_stool) fits.
+
+        @param MoveSequence self:
+        @param int src_stool:
+        @param int dest_stool:
+        @rtype: None
+        """
+        moves = list(self)
+        encoding = self._encoding + 1
+        if min(src_stool, dest_stool) < 0:
+            encoding = len(_MOVE_ENCODINGS)
+        while (encoding < len(_MOVE_ENCODINGS) and
+               max(src_stool, dest_stool) >> _MOVE_ENCODINGS[encoding][1]):
+            encoding += 1
+        self._encoding = encoding
+        if encoding < len(_MOVE_ENCODINGS):
+            typecode, bits = _MOVE_ENCODINGS[encoding]
+            self._moves = array(typecode, [s << bits | d for s, d in moves])
+        else:
+            self._moves = moves
+
+    def __iter__(self):
+        """ Return an iterator over the (src, dest) moves of self.
+
+        @param MoveSequence self:
+        @rtype: iterator[tuple[int]]
+
+        >>> list(MoveSequence([(0, 1), (1, 2)]))
+        [(0, 1), (1, 2)]
+        """
+        if self._encoding == len(_MOVE_ENCODINGS):
+            return iter(self._moves)
+        bits = _MOVE_ENCODINGS[self._encoding][1]
+        mask = (1 << bits) - 1
+        return ((code >> bits, code & mask) for code in self._moves)
 
     def get_move(self, i):
         """ Return the move at position i in self
@@ -368,7 +673,11 @@ class MoveSequence(object):
         True
         """
         # Exception if not (0 <= i < self.length)
-        return self._moves[i]
+        if self._encoding == len(_MOVE_ENCODINGS):
+            return self._moves[i]
+        bits = _MOVE_ENCODINGS[self._encoding][1]
+        code = self._moves[i]
+        return code >> bits, code & ((1 << bits) - 1)
 
     def add_move(self, src_stool, dest_stool):
         """ Add move from src_stool to dest_stool to MoveSequence self.
@@ -377,8 +686,23 @@ class MoveSequence(object):
         @param int src_stool:
         @param int dest_stool:
         @rtype: None
+
+        >>> ms = MoveSequence([])
+        >>> ms.add_move(0, 300)
+        >>> ms.add_move(-1, 2)
+        >>> ms
+        [(0, 300), (-1, 2)]
         """
-        self._moves.append((src_stool, dest_stool))
+        if self._encoding == len(_MOVE_ENCODINGS):
+            self._moves.append((src_stool, dest_stool))
+            return
+        bits = _MOVE_ENCODINGS[self._encoding][1]
+        if (src_stool >> bits or dest_stool >> bits or
+                src_stool < 0 or dest_stool < 0):
+            self._widen(src_stool, dest_stool)
+            self.add_move(src_stool, dest_stool)
+        else:
+            self._moves.append(src_stool << bits | dest_stool)
 
     def length(self):
         """ Return number of moves in self.
@@ -391,7 +715,7 @@ class MoveSequence(object):
         1
         """
         return len(self._moves)
-    
+
     def __repr__(self):
         """Return the object in MoveSequence
 
@@ -402,7 +726,7 @@ class MoveSequence(object):
         >>> M
         []
         """
-        return '{}'.format(self._moves)
+        return '{}'.format(list(self))
 
     def __eq__(self, other):
         """ returns True if MoveSequence equivalent to other
@@ -415,8 +739,12 @@ class MoveSequence(object):
         >>> C = MoveSequence([])
         >>> C == M
         True
+        >>> MoveSequence([(0, 1)]) == MoveSequence([(20, 1)])
+        False
         """
-        return self._moves == other._moves
+        if self._encoding == other._encoding:
+            return self._moves == other._moves
+        return self.length() == other.length() and list(self) == list(other)
 
     def generate_toah_model(self, number_of_stools, number_of_cheeses):
         """ Construct TOAHModel from number_of_stools and number_of_cheeses
@@ -440,11 +768,122 @@ class MoveSequence(object):
         """
         model = TOAHModel(number_of_stools)
         model.fill_first_stool(number_of_cheeses)
-        for move in self._moves:
-            model.move(move[0], move[1])
+        for src_stool, dest_stool in self:
+            model.move(src_stool, dest_stool)
         return model
 
 
+class Verification:
+    """ Outcome of checking a sequence of moves against a TOAH game.
+
+    === Attributes ===
+    @param int number_of_moves: number of legal moves applied
+    @param int|None error_index: position of the first illegal move, if any
+    @param str|None error: why that move is illegal
+    @param bool solved: whether every cheese ended on the last stool
+    """
+
+    def __init__(self, number_of_moves, error_index, error, solved):
+        """ Initialize a new Verification.
+
+        @param Verification self:
+        @param int number_of_moves:
+        @param int|None error_index:
+        @param str|None error:
+        @param bool solved:
+        @rtype: None
+        """
+        self.number_of_moves = number_of_moves
+        self.error_index = error_index
+        self.error = error
+        self.solved = solved
+
+    def __repr__(self):
+        """ Return a string representation of self.
+
+        @param Verification self:
+        @rtype: str
+        """
+        return 'Verification({}, {}, {!r}, {})'.format(
+            self.number_of_moves, self.error_index, self.error, self.solved)
+
+
+class _MissingMove(dict):
+    """ Dict of move -> stool pair that maps unknown moves to None.
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+def verify_moves(moves, number_of_stools, number_of_cheeses):
+    """ Check moves against a game of number_of_cheeses cheeses that start
+    on the first of number_of_stools stools.
+
+    Moves are replayed on plain lists of cheese sizes, without building a
+    TOAHModel or recording the moves again. Checking stops at the first
+    illegal move.
+
+    @param MoveSequence|iterable[tuple[int]] moves:
+    @param int number_of_stools:
+    @param int number_of_cheeses:
+    @rtype: Verification
+
+    >>> verify_moves([(0, 1), (0, 2), (1, 2)], 3, 2)
+    Verification(3, None, None, True)
+    >>> verify_moves([(0, 1), (0, 1)], 3, 2)
+    Verification(1, 1, 'Cannot place a larger cheese on top of a smaller one', False)
+    >>> verify_moves(MoveSequence([(0, 1), (2, 1)]), 3, 2)
+    Verification(1, 1, 'No cheese on Stool', False)
+    """
+    # Every stool keeps a bottom cheese larger than any real one, so a move
+    # is legal exactly when the top of its source is smaller than the top
+    # of its destination.
+    bottom = number_of_cheeses + 1
+    stools = [[bottom] + list(range(number_of_cheeses, 0, -1))]
+    stools += [[bottom] for _ in range(number_of_stools - 1)]
+    # Map each move between two distinct stools straight to the lists of
+    # those stools, so the loop below only checks emptiness and sizes.
+    if (isinstance(moves, MoveSequence) and
+            moves._encoding < len(_MOVE_ENCODINGS)):
+        bits = _MOVE_ENCODINGS[moves._encoding][1]
+        codes = moves._moves
+    else:
+        bits = None
+        codes = moves
+    if bits is not None and bits <= 8:
+        pairs = [None] * (1 << 2 * bits)
+    else:
+        pairs = _MissingMove()
+    for s in range(number_of_stools):
+        for d in range(number_of_stools):
+            if bits is None:
+                pairs[s, d] = (stools[s], stools[d]) if s != d else False
+            elif not (s >> bits or d >> bits):
+                pairs[s << bits | d] = \
+                    (stools[s], stools[d]) if s != d else False
+
+    index = -1
+    for index, code in enumerate(codes):
+        pair = pairs[code]
+        if not pair:
+            if pair is None:
+                error = 'No such stool'
+            else:
+                error = 'Cant place cheese back on same stool!'
+            return Verification(index, index, error, False)
+        source, destination = pair
+        if source[-1] >= destination[-1]:
+            if source[-1] == bottom:
+                error = 'No cheese on Stool'
+            else:
+                error = 'Cannot place a larger cheese on top of a smaller one'
+            return Verification(index, index, error, False)
+        destination.append(source.pop())
+    return Verification(index + 1, None, None,
+                        len(stools[-1]) == number_of_cheeses + 1)
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod(verbose=True)
@@ -0,0 +1,218 @@
+"""
+PatternDatabase: Exact distances for the largest cheeses of a TOAH game,
+stored on disk and shared between processes through mmap.
+
+A pattern database for m cheeses on k stools records, for every one of the
+k ** m placements of those cheeses, the number of moves needed to reach a
+fixed goal placement when every other cheese is ignored. That is a lower
+bound on the moves of those cheeses in the full game, so it can be added
+to a bound on the moves of the smaller cheeses to guide shortest_moves.
+
+File layout (little-endian):
+    8 bytes   magic b'TOAHPDB1'
+    2 bytes   number of stools k
+    2 bytes   number of cheeses m
+    m bytes   goal stool of each pattern cheese, smallest first
+    k ** m nibbles, two per byte (even states in the low nibble): the
+              distance of each state modulo 16
+
+Distances are stored modulo 16 to fit in a nibble. Neighbouring states
+differ in distance by at most one, so a lookup recovers the exact value
+from any neighbour already looked up, falling back on walking down to
+the goal.
+"""
+
+import mmap
+import struct
+from toah_search import encode, misplaced_heuristic, model_locations
+
+_MAGIC = b'TOAHPDB1'
+_HEADER = struct.Struct('<8sHH')
+
+
+def _moves_from(state, k, m, powers):
+    """ Return the states one move away from state.
+
+    @param int state:
+    @param int k:
+    @param int m:
+    @param list[int] powers:
+    @rtype: list[int]
+    """
+    tops = [None] * k
+    rest = state
+    for cheese in range(m):
+        rest, location = divmod(rest, k)
+        if tops[location] is None:
+            tops[location] = cheese
+    neighbours = []
+    for src, cheese in enumerate(tops):
+        if cheese is None:
+            continue
+        for dst, top in enumerate(tops):
+            if dst != src and (top is None or top > cheese):
+                neighbours.append(state + (dst - src) * powers[cheese])
+    return neighbours
+
+
+def build_pattern_database(path, goal_locations, number_of_stools):
+    """ Write the pattern database for cheeses placed as goal_locations
+    (smallest first) on number_of_stools stools to path.
+
+    Distances are found by breadth-first search back from the goal; moves
+    are reversible, so these are also the distances to it.
+
+    @param str path:
+    @param list[int] goal_locations:
+    @param int number_of_stools:
+    @rtype: None
+    """
+    k, m = number_of_stools, len(goal_locations)
+    powers = [k ** c for c in range(m)]
+    unseen = 0xff
+    distances = bytearray([unseen]) * (k ** m)
+    goal = encode(goal_locations, k)
+    distances[goal] = 0
+    frontier, depth = [goal], 0
+    while frontier:
+        depth += 1
+        following = []
+        for state in frontier:
+            for neighbour in _moves_from(state, k, m, powers):
+                if distances[neighbour] == unseen:
+                    distances[neighbour] = depth & 15
+                    following.append(neighbour)
+        frontier = following
+    if len(distances) % 2:
+        distances.append(0)
+    packed = bytes(distances[0::2])
+    packed = bytes(a | b << 4 for a, b in zip(packed, distances[1::2]))
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, k, m))
+        f.write(bytes(goal_locations))
+        f.write(packed)
+
+
+class PatternDatabase:
+    """ A pattern database file, memory-mapped read-only.
+
+    === Attributes ===
+    @param int number_of_stools: stools of the game
+    @param int number_of_cheeses: cheeses in the pattern
+    @param list[int] goal_locations: goal stool of each pattern cheese,
+        smallest first
+    """
+
+    def __init__(self, path, cache_size=1 << 20):
+        """ Open the pattern database at path.
+
+        @param PatternDatabase self:
+        @param str path:
+        @param int cache_size: most exact distances kept between lookups
+        @rtype: None
+        """
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, k, m = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError('{} is not a pattern database'.format(path))
+        self.number_of_stools = k
+        self.number_of_cheeses = m
+        self.goal_locations = list(self._map[_HEADER.size:_HEADER.size + m])
+        self._offset = _HEADER.size + m
+        self._powers = [k ** c for c in range(m)]
+        self._goal = encode(self.goal_locations, k)
+        self._exact = {self._goal: 0}
+        self._cache_size = cache_size
+
+    def close(self):
+        """ Unmap the database file.
+
+        @param PatternDatabase self:
+        @rtype: None
+        """
+        self._map.close()
+
+    def _stored(self, state):
+        """ Return the distance of state modulo 16.
+
+        @param PatternDatabase self:
+        @param int state:
+        @rtype: int
+        """
+        return (self._map[self._offset + (state >> 1)] >>
+                ((state & 1) << 2)) & 15
+
+    def distance(self, state):
+        """ Return the exact number of moves from pattern state to the goal.
+
+        @param PatternDatabase self:
+        @param int state:
+        @rtype: int
+        """
+        exact = self._exact.get(state)
+        if exact is not None:
+            return exact
+        k, m, powers = self.number_of_stools, self.number_of_cheeses, \
+            self._powers
+        stored = self._stored(state)
+        for neighbour in _moves_from(state, k, m, powers):
+            known = self._exact.get(neighbour)
+            if known is not None:
+                for exact in (known - 1, known, known + 1):
+                    if exact % 16 == stored:
+                        break
+                break
+        else:
+            # walk down to the goal, one step closer each time
+            exact, current, value = 0, state, stored
+            while current != self._goal:
+                for neighbour in _moves_from(current, k, m, powers):
+                    if self._stored(neighbour) == (value - 1) % 16:
+                        current, value = neighbour, (value - 1) % 16
+                        break
+                exact += 1
+        if len(self._exact) >= self._cache_size:
+            self._exact = {self._goal: 0}
+        self._exact[state] = exact
+        return exact
+
+    def heuristic(self, goal):
+        """ Return a heuristic for shortest_moves towards TOAHModel goal.
+
+        The pattern covers the largest cheeses of goal, which must sit
+        where this database expects them. The estimate is the pattern
+        distance plus misplaced_heuristic over the smaller cheeses; both
+        count moves of disjoint sets of cheeses, so the sum stays
+        admissible and consistent.
+
+        @param PatternDatabase self:
+        @param TOAHModel goal:
+        @rtype: function
+
+        >>> import os, tempfile
+        >>> from toah_model import TOAHModel, Cheese
+        >>> from toah_search import shortest_moves
+        >>> path = os.path.join(tempfile.mkdtemp(), 'four.pdb')
+        >>> build_pattern_database(path, [3] * 5, 4)
+        >>> db = PatternDatabase(path)
+        >>> start, goal = TOAHModel(4), TOAHModel(4)
+        >>> start.fill_first_stool(7)
+        >>> for size in range(7, 0, -1):
+        ...     goal.add(Cheese(size), 3)
+        >>> shortest_moves(start, goal, db.heuristic(goal)).length()
+        25
+        >>> db.close()
+        """
+        k, m = self.number_of_stools, self.number_of_cheeses
+        goal_locations = model_locations(goal)
+        small = len(goal_locations) - m
+        if (goal.get_number_of_stools() != k or small < 0 or
+                goal_locations[small:] != self.goal_locations):
+            raise ValueError('goal does not match the pattern database')
+        rest = misplaced_heuristic(goal_locations, k, small)
+        distance = self.distance
+
+        def heuristic(locations):
+            return distance(encode(locations[small:], k)) + rest(locations)
+        return heuristic
@@ -0,0 +1,205 @@
+"""
+MoveReplay: Seekable replay of a MoveSequence, for inspecting long runs.
+
+MoveReplay keeps the current configuration as plain lists of cheese sizes
+and snapshots it every `interval` moves as it goes. Seeking to any position
+restores the nearest snapshot at or before it and replays at most
+`interval` moves; stepping backward undoes moves one at a time.
+"""
+
+from toah_model import TOAHModel, Cheese, IllegalMoveError
+
+
+class MoveReplay:
+    """ A position within the replay of a sequence of moves.
+
+    === Attributes ===
+    @param int position: number of moves applied so far
+    @param int interval: number of moves between snapshots
+    """
+
+    def __init__(self, moves, number_of_stools, number_of_cheeses,
+                 interval=1024, max_checkpoints=4096):
+        """ Create a new MoveReplay at position 0.
+
+        Snapshots are taken lazily, as positions are first reached. Once
+        more than max_checkpoints would be kept, the interval doubles and
+        every other snapshot is dropped, so memory stays bounded.
+
+        @param MoveReplay self:
+        @param MoveSequence moves:
+        @param int number_of_stools:
+        @param int number_of_cheeses:
+        @param int interval:
+        @param int max_checkpoints:
+        @rtype: None
+        """
+        self._moves = moves
+        self._number_of_cheeses = number_of_cheeses
+        self._stools = [list(range(number_of_cheeses, 0, -1))]
+        self._stools += [[] for _ in range(number_of_stools - 1)]
+        self._max_checkpoints = max(2, max_checkpoints)
+        self.interval = interval
+        self.position = 0
+        self._checkpoints = [self._snapshot()]
+
+    def _snapshot(self):
+        """ Return the current configuration in compact form: the stool
+        of each cheese, indexed by size - 1.
+
+        @param MoveReplay self:
+        @rtype: bytes|tuple[int]
+        """
+        locations = [0] * self._number_of_cheeses
+        for stool_index, stool in enumerate(self._stools):
+            for size in stool:
+                locations[size - 1] = stool_index
+        if len(self._stools) <= 256:
+            return bytes(locations)
+        return tuple(locations)
+
+    def _restore(self, snapshot):
+        """ Make snapshot the current configuration.
+
+        @param MoveReplay self:
+        @param bytes|tuple[int] snapshot:
+        @rtype: None
+        """
+        self._stools = [[] for _ in self._stools]
+        for size in range(self._number_of_cheeses, 0, -1):
+            self._stools[snapshot[size - 1]].append(size)
+
+    def _forward(self, position):
+        """ Apply moves until self reaches position, taking snapshots
+        along the way.
+
+        @param MoveReplay self:
+        @param int position:
+        @rtype: None
+
+        >>> from toah_model import MoveSequence
+        >>> r = MoveReplay(MoveSequence([(0, 1), (1, 1)]), 3, 2)
+        >>> r.seek(2)
+        Traceback (most recent call last):
+        ...
+        toah_model.IllegalMoveError: Illegal move (1, 1) at position 1
+        """
+        stools, moves = self._stools, self._moves
+        while self.position < position:
+            src, dst = moves.get_move(self.position)
+            if src == dst or not stools[src] or (
+                    stools[dst] and stools[dst][-1] < stools[src][-1]):
+                raise IllegalMoveError('Illegal move {} at position {}'
+                                       .format((src, dst), self.position))
+            stools[dst].append(stools[src].pop())
+            self.position += 1
+            if (self.position % self.interval == 0 and
+                    self.position // self.interval ==
+                    len(self._checkpoints)):
+                self._checkpoints.append(self._snapshot())
+                if len(self._checkpoints) > self._max_checkpoints:
+                    self._checkpoints = self._checkpoints[::2]
+                    self.interval *= 2
+
+    def _backward(self, position):
+        """ Undo moves until self is back at position.
+
+        @param MoveReplay self:
+        @param int position:
+        @rtype: None
+        """
+        stools, moves = self._stools, self._moves
+        while self.position > position:
+            self.position -= 1
+            src, dst = moves.get_move(self.position)
+            stools[src].append(stools[dst].pop())
+
+    def seek(self, position):
+        """ Move self to position, replaying at most self.interval moves
+        once the snapshots up to position have been taken.
+
+        @param MoveReplay self:
+        @param int position:
+        @rtype: None
+
+        >>> from toah_model import MoveSequence
+        >>> ms = MoveSequence([(0, 1), (0, 2), (1, 2)])
+        >>> r = MoveReplay(ms, 3, 2, interval=2)
+        >>> r.seek(3)
+        >>> r.get_locations()
+        [2, 2]
+        >>> r.seek(1)
+        >>> r.get_locations()
+        [1, 0]
+        """
+        if not 0 <= position <= self._moves.length():
+            raise IndexError('position {} is outside the replay'
+                             .format(position))
+        if position >= self.position:
+            checkpoint = min(position // self.interval,
+                             len(self._checkpoints) - 1)
+            if checkpoint * self.interval > self.position:
+                self._restore(self._checkpoints[checkpoint])
+                self.position = checkpoint * self.interval
+            self._forward(position)
+        elif self.position - position <= self.interval:
+            self._backward(position)
+        else:
+            checkpoint = position // self.interval
+            self._restore(self._checkpoints[checkpoint])
+            self.position = checkpoint * self.interval
+            self._forward(position)
+
+    def step(self, count=1):
+        """ Move self count moves forward, or backward if count is
+        negative, stopping at either end of the replay.
+
+        @param MoveReplay self:
+        @param int count:
+        @rtype: None
+
+        >>> from toah_model import MoveSequence
+        >>> r = MoveReplay(MoveSequence([(0, 1), (0, 2), (1, 2)]), 3, 2)
+        >>> r.step(5)
+        >>> r.position
+        3
+        >>> r.step(-1)
+        >>> r.get_locations()
+        [1, 2]
+        """
+        self.seek(max(0, min(self._moves.length(), self.position + count)))
+
+    def get_locations(self):
+        """ Return the stool of each cheese at the current position,
+        indexed by size - 1.
+
+        @param MoveReplay self:
+        @rtype: list[int]
+        """
+        return list(self._snapshot())
+
+    def to_model(self):
+        """ Return a TOAHModel in the configuration at the current position.
+
+        The returned model has an empty move sequence.
+
+        @param MoveReplay self:
+        @rtype: TOAHModel
+
+        >>> from toah_model import MoveSequence
+        >>> ms = MoveSequence([(0, 1), (0, 2)])
+        >>> r = MoveReplay(ms, 3, 2)
+        >>> r.seek(2)
+        >>> r.to_model() == ms.generate_toah_model(3, 2)
+        True
+        """
+        model = TOAHModel(len(self._stools))
+        for stool_index, stool in enumerate(self._stools):
+            for size in stool:
+                model.add(Cheese(size), stool_index)
+        return model
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
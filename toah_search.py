@@ -0,0 +1,239 @@
+"""
+shortest_moves: Exact shortest MoveSequence between two TOAHModel
+configurations, for any number of stools.
+
+A configuration of n cheeses on k stools is encoded as the integer
+sum(location[c] * k ** c), where location[c] is the stool of the (c+1)-th
+smallest cheese. The search is A* over these integers, recording the move
+that first reached each expanded state. Up to _DENSE_STATES possible
+states, the record is one byte per state (two with 16 or more stools),
+allocated up front: 1 GiB for 15 cheeses on 4 stools. Beyond that it is a
+dict of the expanded states only, which is slower and takes about 100
+bytes per expanded state, so a search that must expand more states than
+fit in memory fails with MemoryError.
+"""
+
+import heapq
+from array import array
+from toah_model import Cheese, MoveSequence
+
+# most possible states for which the search allocates one record each
+_DENSE_STATES = 1 << 30
+
+
+def model_locations(model):
+    """ Return the stool of each cheese of model, smallest cheese first.
+
+    @param TOAHModel model:
+    @rtype: list[int]
+
+    >>> from toah_model import TOAHModel
+    >>> M = TOAHModel(3)
+    >>> M.add(Cheese(5), 2)
+    >>> M.add(Cheese(2), 0)
+    >>> model_locations(M)
+    [0, 2]
+    """
+    return [model.get_cheese_location(Cheese(size)) for size in _sizes(model)]
+
+
+def _sizes(model):
+    """ Return the sizes of the cheeses of model, ascending.
+
+    @param TOAHModel model:
+    @rtype: list[int]
+    """
+    return sorted(cheese.size for stool in model._stools for cheese in stool)
+
+
+def encode(locations, number_of_stools):
+    """ Return the integer state for locations, smallest cheese first.
+
+    @param list[int] locations:
+    @param int number_of_stools:
+    @rtype: int
+
+    >>> encode([1, 0, 2], 3)
+    19
+    """
+    state = 0
+    for location in reversed(locations):
+        state = state * number_of_stools + location
+    return state
+
+
+def decode(state, number_of_stools, number_of_cheeses):
+    """ Return the locations encoded by state, smallest cheese first.
+
+    @param int state:
+    @param int number_of_stools:
+    @param int number_of_cheeses:
+    @rtype: list[int]
+
+    >>> decode(19, 3, 3)
+    [1, 0, 2]
+    """
+    locations = []
+    for _ in range(number_of_cheeses):
+        state, location = divmod(state, number_of_stools)
+        locations.append(location)
+    return locations
+
+
+def misplaced_heuristic(goal_locations, number_of_stools,
+                        number_counted=None):
+    """ Return an admissible, consistent heuristic towards goal_locations.
+
+    Every cheese off its goal stool needs at least one move. A cheese on
+    its goal stool needs at least two (away and back) if a larger cheese
+    below it, or one that belongs under it, still has to move. Only the
+    moves of the number_counted smallest cheeses (all, by default) are
+    counted, so the estimate can be added to a bound on the others.
+
+    @param list[int] goal_locations:
+    @param int number_of_stools:
+    @param int|None number_counted:
+    @rtype: function
+
+    >>> h = misplaced_heuristic([2, 2, 2], 3)
+    >>> h([0, 0, 0]), h([2, 0, 2]), h([2, 2, 2])
+    (3, 3, 0)
+    >>> misplaced_heuristic([2, 2, 2], 3, 1)([2, 0, 2])
+    2
+    """
+    if number_counted is None:
+        number_counted = len(goal_locations)
+    order = list(reversed(list(enumerate(goal_locations))))
+
+    def heuristic(locations):
+        dirty = [False] * number_of_stools
+        estimate = 0
+        for cheese, goal in order:
+            location = locations[cheese]
+            if location != goal:
+                if cheese < number_counted:
+                    estimate += 1
+                dirty[location] = dirty[goal] = True
+            elif dirty[location] and cheese < number_counted:
+                estimate += 2
+        return estimate
+    return heuristic
+
+
+def shortest_moves(start, goal, heuristic=None):
+    """ Return a shortest MoveSequence taking start's configuration to
+    goal's.
+
+    start and goal must hold cheeses of the same sizes on the same number
+    of stools. heuristic, if given, maps a list of locations (smallest
+    cheese first) to an admissible, consistent lower bound on the number
+    of moves to goal; misplaced_heuristic is used by default.
+
+    @param TOAHModel start:
+    @param TOAHModel goal:
+    @param function|None heuristic:
+    @rtype: MoveSequence
+
+    >>> from toah_model import TOAHModel
+    >>> start, goal = TOAHModel(3), TOAHModel(3)
+    >>> start.fill_first_stool(3)
+    >>> goal.add(Cheese(3), 1)
+    >>> goal.add(Cheese(2), 2)
+    >>> goal.add(Cheese(1), 2)
+    >>> shortest_moves(start, goal)
+    [(0, 1), (0, 2), (1, 2), (0, 1)]
+
+    With 4 ** 20 possible states, only the expanded ones are recorded:
+
+    >>> start, goal = TOAHModel(4), TOAHModel(4)
+    >>> start.fill_first_stool(20)
+    >>> goal.fill_first_stool(20)
+    >>> goal.move(0, 3)
+    >>> goal.move(0, 1)
+    >>> shortest_moves(start, goal)
+    [(0, 3), (0, 1)]
+    """
+    k = start.get_number_of_stools()
+    sizes = _sizes(start)
+    if goal.get_number_of_stools() != k or _sizes(goal) != sizes:
+        raise ValueError('start and goal must have the same stools and '
+                         'cheeses')
+    n = len(sizes)
+    goal_locations = model_locations(goal)
+    if heuristic is None:
+        heuristic = misplaced_heuristic(goal_locations, k)
+    powers = [k ** c for c in range(n)]
+    start_state = encode(model_locations(start), k)
+    goal_state = encode(goal_locations, k)
+
+    # the move that reached each expanded state, as src * k + dst + 1,
+    # with the largest code marking the start and 0 a state not expanded
+    start_code = 255 if k * k < 255 else 65535
+    if k ** n > _DENSE_STATES:
+        parents = _Parents()
+    elif k * k < 255:
+        parents = bytearray(k ** n)
+    else:
+        parents = array('H', bytes(2 * k ** n))
+    # heap entries hold -g, so that deeper states win ties on f
+    heap = [(heuristic(decode(start_state, k, n)), 0, start_state,
+             start_code)]
+    while heap:
+        _, g, state, code = heapq.heappop(heap)
+        g = -g
+        if parents[state]:
+            continue
+        parents[state] = code
+        if state == goal_state:
+            return _path(parents, state, start_code, powers, k, n)
+        locations = decode(state, k, n)
+        tops = [None] * k
+        for cheese, location in enumerate(locations):
+            if tops[location] is None:
+                tops[location] = cheese
+        for src, cheese in enumerate(tops):
+            if cheese is None:
+                continue
+            for dst, top in enumerate(tops):
+                if dst == src or (top is not None and top < cheese):
+                    continue
+                child = state + (dst - src) * powers[cheese]
+                if parents[child]:
+                    continue
+                locations[cheese] = dst
+                heapq.heappush(heap, (g + 1 + heuristic(locations), -g - 1,
+                                      child, src * k + dst + 1))
+                locations[cheese] = src
+    raise ValueError('goal cannot be reached from start')
+
+
+class _Parents(dict):
+    """ Dict of expanded state -> code of the move that reached it, for
+    searches with too many possible states to allocate a record for each.
+    States that were not expanded have code 0.
+    """
+
+    def __missing__(self, state):
+        return 0
+
+
+def _path(parents, state, start_code, powers, k, n):
+    """ Return the moves recorded in parents that lead to state.
+
+    @param bytearray|array|_Parents parents:
+    @param int state:
+    @param int start_code:
+    @param list[int] powers:
+    @param int k:
+    @param int n:
+    @rtype: MoveSequence
+    """
+    moves = []
+    while parents[state] != start_code:
+        src, dst = divmod(parents[state] - 1, k)
+        moves.append((src, dst))
+        # the moved cheese is now the smallest one on dst
+        cheese = decode(state, k, n).index(dst)
+        state -= (dst - src) * powers[cheese]
+    moves.reverse()
+    return MoveSequence(moves)
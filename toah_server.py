@@ -0,0 +1,285 @@
+"""
+GameServer: Many console games served at once over TCP or a Unix socket.
+
+Each connection is one session with its own ConsoleController, and speaks
+the console protocol line by line: the server sends the instructions and
+the prompt, and answers every x,y / Info command with what play_loop would
+print, followed by the prompt again. Quit ends the session.
+
+All sessions share one asyncio event loop. A session is closed when it is
+idle for idle_timeout seconds, sends a line longer than max_line bytes, or
+makes more than max_moves moves, so the memory of each stays bounded.
+
+load_test connects many clients that each play a tour and reports the
+latency of their moves, from sending a move to receiving the next prompt.
+"""
+
+import asyncio
+import math
+import time
+from console_controller import ConsoleController
+from tour import tour_moves
+
+PROMPT = "Enter a move or type Quit to exit: "
+QUIT_MESSAGE = "\nYou have successfully quit the game!\n"
+
+
+class GameServer:
+    """ A server for console games.
+
+    === Attributes ===
+    @param int number_of_cheeses: cheeses of every game
+    @param int number_of_stools: stools of every game
+    @param float idle_timeout: seconds a session may wait between commands
+    @param int max_moves: most moves a session may make
+    @param int max_line: longest command accepted, in bytes
+    @param int max_sessions: most sessions served at once
+    @param int sessions: sessions being served
+    """
+
+    def __init__(self, number_of_cheeses, number_of_stools, idle_timeout=300,
+                 max_moves=1 << 16, max_line=256, max_sessions=10000):
+        """ Create a new GameServer, not yet listening.
+
+        @param GameServer self:
+        @param int number_of_cheeses:
+        @param int number_of_stools:
+        @param float idle_timeout:
+        @param int max_moves:
+        @param int max_line:
+        @param int max_sessions:
+        @rtype: None
+        """
+        self.number_of_cheeses = number_of_cheeses
+        self.number_of_stools = number_of_stools
+        self.idle_timeout = idle_timeout
+        self.max_moves = max_moves
+        self.max_line = max_line
+        self.max_sessions = max_sessions
+        self.sessions = 0
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """ Start listening on host and port, or on the Unix socket at path
+        if it is given, and return the asyncio server.
+
+        @param GameServer self:
+        @param str host:
+        @param int port:
+        @param str|None path:
+        @rtype: asyncio.AbstractServer
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(
+                self.serve, path, limit=self.max_line,
+                backlog=self.max_sessions)
+        return await asyncio.start_server(self.serve, host, port,
+                                          limit=self.max_line,
+                                          backlog=self.max_sessions)
+
+    async def serve(self, reader, writer):
+        """ Play one session with the client at the other end of reader and
+        writer.
+
+        @param GameServer self:
+        @param asyncio.StreamReader reader:
+        @param asyncio.StreamWriter writer:
+        @rtype: None
+        """
+        if self.sessions >= self.max_sessions:
+            writer.write(b'Server is full, try again later\n')
+            await _close(writer)
+            return
+        self.sessions += 1
+        try:
+            await self._play(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions -= 1
+            await _close(writer)
+
+    async def _play(self, reader, writer):
+        """ Answer the commands of one session until it quits or breaks a
+        limit.
+
+        @param GameServer self:
+        @param asyncio.StreamReader reader:
+        @param asyncio.StreamWriter writer:
+        @rtype: None
+        """
+        play = ConsoleController(self.number_of_cheeses,
+                                 self.number_of_stools)
+        writer.write((play.instructions + '\n' + PROMPT).encode())
+        while True:
+            await writer.drain()
+            try:
+                line = await asyncio.wait_for(reader.readline(),
+                                              self.idle_timeout)
+            except asyncio.TimeoutError:
+                writer.write(b'\nSession timed out\n')
+                return
+            except ValueError:
+                writer.write(b'\nCommand too long\n')
+                return
+            if not line:
+                return
+            command = line.decode(errors='replace').rstrip('\r\n')
+            if command == 'Quit':
+                writer.write(QUIT_MESSAGE.encode())
+                return
+            if play.toah.number_of_moves() >= self.max_moves:
+                writer.write(b'\nMove limit reached\n')
+                return
+            writer.write((play.respond(command) + '\n' + PROMPT).encode())
+
+
+async def _close(writer):
+    """ Flush and close writer, ignoring a client that has gone away.
+
+    @param asyncio.StreamWriter writer:
+    @rtype: None
+    """
+    try:
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
+
+
+def percentile(latencies, fraction):
+    """ Return the nearest-rank percentile fraction of sorted latencies.
+
+    @param list[float] latencies:
+    @param float fraction:
+    @rtype: float
+
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.5)
+    2.0
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.99)
+    4.0
+    """
+    index = math.ceil(len(latencies) * fraction) - 1
+    return latencies[min(max(index, 0), len(latencies) - 1)]
+
+
+async def _client(connect, moves, latencies):
+    """ Play moves in one session and append the latency of each.
+
+    @param function connect:
+    @param list[tuple[int]] moves:
+    @param list[float] latencies:
+    @rtype: None
+    """
+    reader, writer = await connect()
+    prompt = PROMPT.encode()
+    clock = time.perf_counter
+    await reader.readuntil(prompt)
+    for src, dst in moves:
+        start = clock()
+        writer.write('{},{}\n'.format(src + 1, dst + 1).encode())
+        await reader.readuntil(prompt)
+        latencies.append(clock() - start)
+    writer.write(b'Quit\n')
+    await reader.read()
+    writer.close()
+
+
+async def load_test(number_of_cheeses, number_of_stools, sessions=100,
+                    host='127.0.0.1', port=None, path=None):
+    """ Play a tour in each of sessions concurrent sessions against the
+    server at host and port, or at the Unix socket path, and return the
+    move latency percentiles, in seconds.
+
+    If neither port nor path is given, a GameServer is started for the
+    test on a free port.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param int sessions:
+    @param str host:
+    @param int|None port:
+    @param str|None path:
+    @rtype: dict
+
+    >>> stats = asyncio.run(load_test(3, 3, sessions=5))
+    >>> stats['moves']
+    35
+    >>> stats['p50'] <= stats['p99']
+    True
+    """
+    server = None
+    if port is None and path is None:
+        server = await GameServer(number_of_cheeses,
+                                  number_of_stools).start(host)
+        port = server.sockets[0].getsockname()[1]
+    if path is not None:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(host, port)
+    moves = list(tour_moves(number_of_cheeses, number_of_stools))
+    latencies = []
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(_client(connect, moves, latencies)
+                               for _ in range(sessions)))
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'sessions': sessions, 'moves': len(latencies),
+            'seconds': elapsed,
+            'moves_per_second': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99)}
+
+
+async def _serve_forever(server, args):
+    """ Run server on the address in args until cancelled.
+
+    @param GameServer server:
+    @param argparse.Namespace args:
+    @rtype: None
+    """
+    listening = await server.start(args.host, args.port, args.unix)
+    print('Serving on', ', '.join(str(s.getsockname())
+                                  for s in listening.sockets))
+    async with listening:
+        await listening.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Serve console games, or load-test a server.')
+    parser.add_argument('mode', choices=['serve', 'load'])
+    parser.add_argument('--cheeses', type=int, default=5)
+    parser.add_argument('--stools', type=int, default=4)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--unix', metavar='PATH', default=None)
+    parser.add_argument('--idle-timeout', type=float, default=300)
+    parser.add_argument('--sessions', type=int, default=100,
+                        help='concurrent clients, for load')
+    args = parser.parse_args()
+    if args.mode == 'serve':
+        if args.port is None:
+            args.port = 8765
+        try:
+            asyncio.run(_serve_forever(
+                GameServer(args.cheeses, args.stools, args.idle_timeout),
+                args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        stats = asyncio.run(load_test(args.cheeses, args.stools,
+                                      args.sessions, args.host, args.port,
+                                      args.unix))
+        print('{sessions} sessions, {moves} moves in {seconds:.2f} s '
+              '({moves_per_second:.0f} moves/s)'.format(**stats))
+        print('move latency p50 {:.3f} ms, p99 {:.3f} ms'.format(
+            stats['p50'] * 1000, stats['p99'] * 1000))
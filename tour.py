@@ -2,11 +2,15 @@
 functions to run TOAH tours.
 """
 
+import multiprocessing
+import sys
 import time
-from toah_model import TOAHModel
+from multiprocessing import shared_memory
+from toah_model import TOAHModel, Cheese, MoveSequence
 
 
-def tour_of_four_stools(model, delay_btw_moves=0.5, animate=False):
+def tour_of_four_stools(model, delay_btw_moves=0.5, animate=False,
+                        iterative=False, frame_rate=None):
     """Move a tower of cheeses from the first stool in model to the fourth.
 
     @type model: TOAHModel
@@ -16,7 +20,16 @@ def tour_of_four_stools(model, delay_btw_moves=0.5, animate=False):
         time delay between moves if console_animate is True
     @type animate: bool
         animate the tour or not
+    @type iterative: bool
+        solve with an explicit stack instead of recursion
+    @type frame_rate: float | None
+        if given, animate at this many frames per second instead of
+        pausing delay_btw_moves after every move
     """
+    if iterative:
+        tour_of_stools(model, delay_btw_moves, animate, frame_rate)
+        return
+
     def hanoi(n, source, temp1, temp2, destination):
         """
 
@@ -40,24 +53,21 @@ def tour_of_four_stools(model, delay_btw_moves=0.5, animate=False):
     
             if n == 1:
                 model.move(source, destination)
-                if animate:
-                    time.sleep(delay_btw_moves)
-                    print(str(model))
+                if animation:
+                    animation()
             else:
                 stools3(n - 1, source, destination, temp1)
                 model.move(source, destination)
-                if animate:
-                    time.sleep(delay_btw_moves)
-                    print(str(model))
+                if animation:
+                    animation()
                 stools3(n - 1, temp1, source, destination)
         
-                
-        i = optimal_i(n)
+
+        i = splits[n]
         if n == 1:
             model.move(source, destination)
-            if animate:
-                time.sleep(delay_btw_moves)
-                print(str(model))
+            if animation:
+                animation()
         else:
             hanoi(n-i, source, temp2, destination, temp1)
             stools3(i, source, temp2, destination)
@@ -65,40 +75,468 @@ def tour_of_four_stools(model, delay_btw_moves=0.5, animate=False):
         
                 
     n = model.get_number_of_cheeses()
+    splits = split_table(n)[1]
+    animation = ConsoleAnimation(model, delay_btw_moves, frame_rate) \
+        if animate else None
     hanoi(n, 0, 1, 2, 3)
+    if animation:
+        animation.finish()
 
     
+def tour_moves(number_of_cheeses, number_of_stools=4, iterative=True):
+    """Yield the (src, dst) moves of a tour of number_of_cheeses cheeses
+    from the first to the last of number_of_stools stools.
+
+    Moves are produced lazily, so no TOAHModel or MoveSequence is needed
+    to consume them. The iterative solver keeps its pending subproblems
+    on an explicit stack and is not limited by the recursion depth.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param bool iterative:
+    @rtype: generator[tuple[int]]
+
+    >>> list(tour_moves(2, 3))
+    [(0, 1), (0, 2), (1, 2)]
+    >>> sum(1 for _ in tour_moves(17)) == min_moves(17)
+    True
+    >>> list(tour_moves(9, 5)) == list(tour_moves(9, 5, iterative=False))
+    True
+    """
+    split_table(number_of_cheeses, number_of_stools)
+    stools = tuple(range(number_of_stools))
+    if iterative:
+        return _stools_moves_iter(number_of_cheeses, stools)
+    return _stools_moves(number_of_cheeses, stools)
+
+
+def _stools_moves(n, stools):
+    """Yield the moves for n cheeses from stools[0] to stools[-1], using
+    the stools in between as spares.
+
+    @param int n:
+    @param tuple[int] stools:
+    @rtype: generator[tuple[int]]
+    """
+    if n == 0:
+        return
+    if n == 1:
+        yield stools[0], stools[-1]
+        return
+    i = _SPLIT_TABLES[len(stools)][1][n]
+    source, temp, rest = stools[0], stools[1], stools[2:]
+    yield from _stools_moves(n - i, (source,) + rest + (temp,))
+    yield from _stools_moves(i, (source,) + rest)
+    yield from _stools_moves(n - i, (temp, source) + rest)
+
+
+def _stools_moves_iter(n, stools):
+    """Yield the same moves as _stools_moves, without recursion.
+
+    @param int n:
+    @param tuple[int] stools:
+    @rtype: generator[tuple[int]]
+    """
+    splits = {k: _SPLIT_TABLES[k][1] for k in range(3, len(stools) + 1)}
+    stack = [(n, stools)]
+    pop, push = stack.pop, stack.append
+    while stack:
+        n, stools = pop()
+        if n == 1:
+            yield stools[0], stools[-1]
+        elif n > 1:
+            i = splits[len(stools)][n]
+            source, temp, rest = stools[0], stools[1], stools[2:]
+            # pushed in reverse, so the top block is moved aside first
+            push((n - i, (temp, source) + rest))
+            push((i, (source,) + rest))
+            push((n - i, (source,) + rest + (temp,)))
+
+
+def tour_of_stools(model, delay_btw_moves=0.5, animate=False,
+                   frame_rate=None):
+    """Move a tower of cheeses from the first stool in model to the last,
+    for any number of stools.
+
+    @type model: TOAHModel
+        TOAHModel with tower of cheese on first stool and the other
+        stools empty
+    @type delay_btw_moves: float
+        time delay between moves if animate is True
+    @type animate: bool
+        animate the tour or not
+    @type frame_rate: float | None
+        if given, animate at this many frames per second instead of
+        pausing delay_btw_moves after every move
+
+    >>> M = TOAHModel(5)
+    >>> M.fill_first_stool(6)
+    >>> tour_of_stools(M)
+    >>> M.get_number_of_cheeses() == len(M._stools[4])
+    True
+    """
+    animation = ConsoleAnimation(model, delay_btw_moves, frame_rate) \
+        if animate else None
+    for src, dst in tour_moves(model.get_number_of_cheeses(),
+                               model.get_number_of_stools()):
+        model.move(src, dst)
+        if animation:
+            animation()
+    if animation:
+        animation.finish()
+
+
+class ConsoleAnimation:
+    """ Show a TOAHModel on the console as moves are made.
+
+    Without a frame rate, every move is printed after a fixed delay. With
+    one, the solver is never paused: a frame is drawn only when the frame
+    interval has passed since the last one, and frames are redrawn in
+    place using ANSI cursor control instead of scrolling.
+    """
+
+    def __init__(self, model, delay_btw_moves=0.5, frame_rate=None,
+                 out=None):
+        """ Create a new ConsoleAnimation of model.
+
+        @param ConsoleAnimation self:
+        @param TOAHModel model:
+        @param float delay_btw_moves:
+        @param float|None frame_rate:
+        @param file|None out: where to draw, sys.stdout by default
+        @rtype: None
+        """
+        self._model = model
+        self._delay = delay_btw_moves
+        self._frame_interval = 1 / frame_rate if frame_rate else None
+        self._out = out if out is not None else sys.stdout
+        self._next_frame = time.perf_counter()
+        self._lines = 0
+
+    def __call__(self):
+        """ Report that a move was made on the model.
+
+        @param ConsoleAnimation self:
+        @rtype: None
+        """
+        if self._frame_interval is None:
+            time.sleep(self._delay)
+            print(str(self._model), file=self._out)
+            return
+        now = time.perf_counter()
+        if now >= self._next_frame:
+            self._next_frame = now + self._frame_interval
+            self._draw()
+
+    def finish(self):
+        """ Draw the final state, if it was skipped.
+
+        @param ConsoleAnimation self:
+        @rtype: None
+
+        >>> import io
+        >>> M = TOAHModel(3)
+        >>> M.fill_first_stool(1)
+        >>> out = io.StringIO()
+        >>> animation = ConsoleAnimation(M, frame_rate=1, out=out)
+        >>> M.move(0, 2)
+        >>> animation()
+        >>> animation.finish()
+        >>> out.getvalue().count('moves: 1')
+        2
+        """
+        if self._frame_interval is not None:
+            self._draw()
+
+    def _draw(self):
+        """ Draw the model over the previous frame.
+
+        @param ConsoleAnimation self:
+        @rtype: None
+        """
+        lines = str(self._model).split('\n')
+        lines.append('moves: {}'.format(self._model.number_of_moves()))
+        frame = ''.join([line + '\x1b[K\n' for line in lines])
+        if self._lines:
+            # back to the start of the previous frame
+            frame = '\x1b[{}F'.format(self._lines) + frame
+        if len(lines) < self._lines:
+            frame += '\x1b[J'
+        self._lines = len(lines)
+        self._out.write(frame)
+        self._out.flush()
+
+
+def tour_locations(number_of_cheeses, number_of_stools, k):
+    """Return the stool of each cheese after the first k moves of
+    tour_moves(number_of_cheeses, number_of_stools).
+
+    The state is derived by descending the Frame-Stewart decomposition,
+    so it takes time polynomial in number_of_cheeses rather than k moves.
+    Element s - 1 of the result is the stool of the cheese of size s.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param int k:
+    @rtype: list[int]
+
+    >>> [tour_locations(3, 3, k) for k in (0, 3, 7)]
+    [[0, 0, 0], [1, 1, 0], [2, 2, 2]]
+    """
+    n = number_of_cheeses
+    costs = split_table(n, number_of_stools)[0]
+    if not 0 <= k <= costs[n]:
+        raise ValueError('k must be between 0 and {}'.format(costs[n]))
+    locations = [0] * n
+    stools = tuple(range(number_of_stools))
+    # the block being solved holds sizes offset + 1 .. offset + n
+    offset = 0
+    while n > 0:
+        if k == 0 or n == 1:
+            stool = stools[-1] if k else stools[0]
+            locations[offset:offset + n] = [stool] * n
+            break
+        costs, splits = _SPLIT_TABLES[len(stools)]
+        i = splits[n]
+        top = n - i
+        across = _SPLIT_TABLES[len(stools) - 1][0][i] \
+            if len(stools) > 3 else 1
+        source, temp, rest = stools[0], stools[1], stools[2:]
+        if k < costs[top]:
+            locations[offset + top:offset + n] = [source] * i
+            n, stools = top, (source,) + rest + (temp,)
+        elif k < costs[top] + across:
+            locations[offset:offset + top] = [temp] * top
+            k -= costs[top]
+            n, stools, offset = i, (source,) + rest, offset + top
+        else:
+            locations[offset + top:offset + n] = [stools[-1]] * i
+            k -= costs[top] + across
+            n, stools = top, (temp, source) + rest
+    return locations
+
+
+def tour_model_after(number_of_cheeses, number_of_stools, k):
+    """Return a TOAHModel in the configuration reached after the first k
+    moves of the tour, without replaying them.
+
+    The returned model has an empty move sequence.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param int k:
+    @rtype: TOAHModel
+
+    >>> from toah_model import MoveSequence
+    >>> moves = MoveSequence(list(tour_moves(8, 4)))
+    >>> M = TOAHModel(4)
+    >>> M.fill_first_stool(8)
+    >>> for src, dst in list(moves)[:20]:
+    ...     M.move(src, dst)
+    >>> tour_model_after(8, 4, 20) == M
+    True
+    """
+    locations = tour_locations(number_of_cheeses, number_of_stools, k)
+    model = TOAHModel(number_of_stools)
+    for size in range(number_of_cheeses, 0, -1):
+        model.add(Cheese(size), locations[size - 1])
+    return model
+
+
+def tour_move_sequence(number_of_cheeses, number_of_stools=4,
+                       processes=1):
+    """Return the moves of tour_moves(number_of_cheeses, number_of_stools)
+    as a packed MoveSequence.
+
+    Each Frame-Stewart subproblem is solved once in canonical stool
+    labels and relabeled with bytes.translate, so the two outer sub-tours
+    cost a copy rather than a solve. With more than one process, the tour
+    is split into subproblems that a process pool writes straight into
+    their offsets of a shared buffer.
+
+    @param int number_of_cheeses:
+    @param int number_of_stools:
+    @param int processes:
+    @rtype: MoveSequence
+
+    >>> list(tour_move_sequence(9, 5)) == list(tour_moves(9, 5))
+    True
+    >>> tour_move_sequence(12, 3, processes=2) == tour_move_sequence(12, 3)
+    True
+    """
+    n = number_of_cheeses
+    total = split_table(n, number_of_stools)[0][n]
+    if number_of_stools > 16:
+        return MoveSequence(list(tour_moves(n, number_of_stools)))
+    if processes <= 1:
+        return MoveSequence.from_packed(
+            _packed_moves(n, number_of_stools, {}))
+    # split the largest subproblem until every process has a few tasks
+    tasks = [(n, tuple(range(number_of_stools)), 0)]
+    while len(tasks) < 4 * processes:
+        task = max(tasks)
+        n, stools, offset = task
+        if n < 2:
+            break
+        tasks.remove(task)
+        costs, splits = _SPLIT_TABLES[len(stools)]
+        i = splits[n]
+        source, temp, rest = stools[0], stools[1], stools[2:]
+        tasks += [(n - i, (source,) + rest + (temp,), offset),
+                  (i, (source,) + rest, offset + costs[n - i]),
+                  (n - i, (temp, source) + rest,
+                   offset + costs[n] - costs[n - i])]
+    buffer = shared_memory.SharedMemory(create=True, size=max(1, total))
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(_write_packed_task,
+                     [(buffer.name,) + task for task in tasks])
+        return MoveSequence.from_packed(buffer.buf[:total])
+    finally:
+        buffer.close()
+        buffer.unlink()
+
+
+def _write_packed_task(task):
+    """Write the packed moves of one subproblem into a shared buffer.
+
+    Runs in a pool worker. task is (buffer name, number of cheeses,
+    stool labels, offset of the first move).
+
+    @param tuple task:
+    @rtype: None
+    """
+    name, n, stools, offset = task
+    if n > 1:
+        split_table(n, len(stools))
+    moves = _packed_moves(n, len(stools), _WORKER_PACKED)
+    buffer = shared_memory.SharedMemory(name=name)
+    try:
+        buffer.buf[offset:offset + len(moves)] = \
+            moves.translate(_relabeling(stools))
+    finally:
+        buffer.close()
+
+
+# canonical packed tours already solved by this pool worker
+_WORKER_PACKED = {}
+
+
+def _relabeling(stools):
+    """Return a bytes.translate table that renames canonical stool j to
+    stools[j] in packed moves.
+
+    @param tuple[int] stools:
+    @rtype: bytes
+    """
+    table = bytearray(range(256))
+    for s in range(len(stools)):
+        for d in range(len(stools)):
+            table[s << 4 | d] = stools[s] << 4 | stools[d]
+    return bytes(table)
+
+
+def _packed_moves(n, number_of_stools, memo):
+    """Return the packed moves for n cheeses from stool 0 to stool
+    number_of_stools - 1, reusing the subproblems in memo.
+
+    @param int n:
+    @param int number_of_stools:
+    @param dict memo:
+    @rtype: bytes
+    """
+    key = (n, number_of_stools)
+    if key in memo:
+        return memo[key]
+    if n <= 1:
+        moves = bytes([number_of_stools - 1] * n)
+    else:
+        i = _SPLIT_TABLES[number_of_stools][1][n]
+        stools = tuple(range(number_of_stools))
+        source, temp, rest = stools[0], stools[1], stools[2:]
+        top = _packed_moves(n - i, number_of_stools, memo)
+        moves = b''.join([
+            top.translate(_relabeling((source,) + rest + (temp,))),
+            _packed_moves(i, number_of_stools - 1, memo)
+            .translate(_relabeling((source,) + rest)),
+            top.translate(_relabeling((temp, source) + rest))])
+    memo[key] = moves
+    return moves
+
+
+# Frame-Stewart cost and split tables, keyed by number of stools. Each entry
+# is a pair of lists (costs, splits) indexed by number of cheeses; tables are
+# grown on demand and shared by every caller.
+_SPLIT_TABLES = {}
+
+
+def split_table(n, number_of_stools=4):
+    """Return (costs, splits) covering at least 0..n cheeses on
+    number_of_stools stools.
+
+    costs[m] is the Frame-Stewart number of moves for m cheeses, and
+    splits[m] is the smallest number of bottom cheeses i that achieves it,
+    i.e. the tour moves m - i cheeses aside with every stool, i cheeses
+    across with one stool fewer, then the m - i cheeses back on top.
+
+    @param int n:
+    @param int number_of_stools:
+    @rtype: tuple[list[int], list[int]]
+
+    >>> costs, splits = split_table(6)
+    >>> costs[:7]
+    [0, 1, 3, 5, 9, 13, 17]
+    >>> splits[1:7]
+    [1, 1, 2, 2, 2, 3]
+    >>> split_table(5, 3)[0][:6]
+    [0, 1, 3, 7, 15, 31]
+    """
+    if number_of_stools < 3:
+        raise ValueError('Need at least 3 stools to move a tower')
+    costs, splits = _SPLIT_TABLES.setdefault(number_of_stools, ([0], [0]))
+    if len(costs) > n:
+        return costs, splits
+    if number_of_stools == 3:
+        for m in range(len(costs), n + 1):
+            costs.append(2 ** m - 1)
+            splits.append(1)
+        return costs, splits
+    fewer = split_table(n, number_of_stools - 1)[0]
+    for m in range(len(costs), n + 1):
+        best, best_i = 2 * costs[m - 1] + fewer[1], 1
+        for i in range(2, m):
+            c = 2 * costs[m - i] + fewer[i]
+            if c < best:
+                best, best_i = c, i
+        costs.append(best)
+        splits.append(best_i)
+    return costs, splits
+
+
 def min_moves(n):
     """Return the minimun number of moves for the given n(number of cheeses).
 
     @param n: int
     @rtype int:
+
+    >>> min_moves(17)
+    193
     """
-    l = []
-    if n == 1:
-        return 1
-    for i in range(1, n):
-        m = 2 * min_moves(n-i) + 2**i - 1
-        l.append(m)
-        moves = min(l)       
-    return moves
-    
+    return split_table(n)[0][n]
+
+
 def optimal_i(n):
     """
     return the optimal i for the given n(number of cheeses).
-    
+
     @param n: int
     @rtype int:
+
+    >>> optimal_i(17)
+    5
     """
-    if n == 1:
-        return 1
-    for i in range(1, n):
-        m = 2 * min_moves(n-i) + 2**i - 1
-        moves = min_moves(n)
-        if m == moves:
-            return i
-    
-    
+    return split_table(n)[1][n]
+
 
 if __name__ == '__main__':
     num_cheeses = 17